@@ -1,5 +1,7 @@
-from typing import Optional
-import subprocess
+from typing import Dict, List, Optional, Tuple
+import functools
+import os
+import re
 import sys
 import time
 from datetime import datetime
@@ -8,25 +10,119 @@ from utils import LogManager, EnvVars
 from database.database_manager import DatabaseManager
 
 
+# Fetch only the requested ref: no tag auto-following, no submodule recursion (and no FETCH_HEAD write
+# where git supports skipping it)
+GIT_FETCH_OPTIONS = ['--no-tags', '--recurse-submodules=no']
+
+
+@functools.cache
+def _git_fetch_options() -> List[str]:
+    """GIT_FETCH_OPTIONS plus --no-write-fetch-head when the installed git (2.29 or later) accepts it"""
+    output, success = run_command(['git', '--version'])
+    match = re.search(r'(\d+)\.(\d+)', output) if success else None
+    if match and (int(match.group(1)), int(match.group(2))) >= (2, 29):
+        return [*GIT_FETCH_OPTIONS, '--no-write-fetch-head']
+    return GIT_FETCH_OPTIONS
+
+
+def _dir_size(path: str) -> int:
+    """Total size in bytes of the files under path"""
+    total = 0
+    pending = [path]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def _stat_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _read_packed_ref(packed_refs_path: str, ref: str) -> Optional[str]:
+    with open(packed_refs_path) as f:
+        for line in f:
+            if line.startswith(('#', '^')):
+                continue
+            sha, _, name = line.strip().partition(' ')
+            if name == ref:
+                return sha
+    return None
+
+
 class FirmwareUpdater:
+    # git dir -> (HEAD mtime, HEAD ref, ref file mtime, packed-refs mtime, SHA) from its last HEAD lookup
+    _head_cache: Dict[str, Tuple[int, Optional[str], Optional[int], Optional[int], str]] = {}
 
-    def __init__(self, target_tag: str, force_update: bool):
+    def __init__(self, target_tag: str, force_update: bool, db: Optional[DatabaseManager] = None):
         self.logger = LogManager().get_logger("FirmwareUpdater")
-        self.repo_path = EnvVars().repository_path
+        self.env = EnvVars()
+        self.repo_path = self.env.repository_path
+        self.db = db if db is not None else DatabaseManager(self.env.db_path)
         self.current_version: Optional[str] = None
         self.target_tag: str = target_tag
         self.force_update: bool = force_update
         self.get_current_version()
 
 
+    def read_head_sha(self) -> Optional[str]:
+        """
+        Resolve HEAD by reading .git/HEAD and the ref it points to, avoiding a git subprocess.
+        The result is cached until HEAD, the ref file or packed-refs change.
+        """
+        git_dir = os.path.join(self.repo_path, '.git')
+        head_path = os.path.join(git_dir, 'HEAD')
+        packed_refs_path = os.path.join(git_dir, 'packed-refs')
+        try:
+            head_mtime = os.stat(head_path).st_mtime_ns
+            cached = FirmwareUpdater._head_cache.get(git_dir)
+            if cached and cached[0] == head_mtime:
+                _, ref, ref_mtime, packed_mtime, sha = cached
+                if ref is None or (ref_mtime == _stat_mtime(os.path.join(git_dir, ref)) and
+                                   packed_mtime == _stat_mtime(packed_refs_path)):
+                    return sha
+
+            with open(head_path) as f:
+                head = f.read().strip()
+            if not head.startswith('ref: '):
+                # Detached HEAD holds the SHA itself
+                ref, ref_mtime, packed_mtime, sha = None, None, None, head
+            else:
+                ref = head[5:]
+                ref_path = os.path.join(git_dir, ref)
+                ref_mtime = _stat_mtime(ref_path)
+                packed_mtime = _stat_mtime(packed_refs_path)
+                if ref_mtime is not None:
+                    with open(ref_path) as f:
+                        sha = f.read().strip()
+                else:
+                    sha = _read_packed_ref(packed_refs_path, ref)
+                    if sha is None:
+                        return None
+            FirmwareUpdater._head_cache[git_dir] = (head_mtime, ref, ref_mtime, packed_mtime, sha)
+            return sha
+        except OSError as e:
+            self.logger.debug(f"Could not read git HEAD directly: {e}")
+            return None
+
+
     def get_current_version(self):
         """Get current git reference."""
-        output, success = run_command(['git', 'rev-parse', 'HEAD'])
+        output = self.read_head_sha()
+        success = output is not None
+        if not success:
+            output, success = run_command(['git', 'rev-parse', 'HEAD'])
         if success:
             self.current_version = output
             self.logger.info(f"Current git version is {output}")
-        db = DatabaseManager(EnvVars().db_path)
-        db_version = db.get_current_firmware_version()
+        db_version = self.db.get_current_firmware_version()
         if db_version:
             self.logger.info(f"Current registered version: {db_version['version_tag']} at {db_version['timestamp']}")
             if db_version['version_tag'] != self.current_version:
@@ -35,11 +131,18 @@ class FirmwareUpdater:
             self.logger.info("No previous Firmware version registered.")
 
 
-    def backup_current_state(self):
-        """Create a backup of the current state."""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_ref = f"backup_{timestamp}"
-        run_command(['git', 'tag', backup_ref])
+    @staticmethod
+    def _backup_ref_name() -> str:
+        return f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+    def backup_current_state(self) -> Optional[str]:
+        """Create a backup of the current state.  Returns the backup reference, or None on failure."""
+        backup_ref = self._backup_ref_name()
+        _, success = run_command(['git', 'tag', backup_ref], self.logger)
+        if not success:
+            self.logger.error(f"Failed to create backup reference: {backup_ref}")
+            return None
         self.logger.info(f"Created backup reference: {backup_ref}")
         return backup_ref
 
@@ -48,18 +151,21 @@ class FirmwareUpdater:
         """Update the repository to the target reference."""
         self.logger.info(f"Updating to: {target_ref}")
 
-        # Fetch only the target reference
+        # Fetch only the target reference, straight into its local ref
         if target_ref.startswith('v'):  # Tag
-            _, fetch_success = run_command(['git', 'fetch', 'origin', f'refs/tags/{target_ref}'], self.logger)
+            refspec = f'+refs/tags/{target_ref}:refs/tags/{target_ref}'
         else:  # Branch
-            _, fetch_success = run_command(['git', 'fetch', 'origin', target_ref], self.logger)
+            refspec = f'+refs/heads/{target_ref}:refs/remotes/origin/{target_ref}'
+        _, fetch_success = run_command(['git', 'fetch', *_git_fetch_options(), 'origin', refspec], self.logger)
 
         if not fetch_success:
             self.logger.error("Failed to fetch updates")
             return False
 
-        # Create backup
+        # Create backup; without it a failed checkout could not be rolled back
         backup_ref = self.backup_current_state()
+        if backup_ref is None:
+            return False
 
         # Try to update to target reference
         if target_ref.startswith('v'):
@@ -69,7 +175,7 @@ class FirmwareUpdater:
                 self.rollback(backup_ref)
                 return False
 
-        # Pull latest changes if it's a branch
+        # Reset the branch to the freshly fetched remote-tracking ref (no separate pull needed)
         else:
             _, branch_success = run_command(['git', 'checkout', '-B', target_ref, '-t',
                                              f'origin/{target_ref}'], self.logger)
@@ -77,11 +183,6 @@ class FirmwareUpdater:
                 self.logger.error(f"Failed to checkout branch {target_ref}")
                 self.rollback(backup_ref)
                 return False
-            _, pull_success = run_command(['git', 'pull', 'origin', target_ref], self.logger)
-            if not pull_success:
-                self.logger.error("Failed to pull updates")
-                self.rollback(backup_ref)
-                return False
 
         self.target_tag = target_ref
         return True
@@ -112,8 +213,7 @@ class FirmwareUpdater:
             if not self.update_repository(self.target_tag):
                 return False
 
-            db = DatabaseManager(EnvVars().db_path)
-            db.add_firmware_version(self.target_tag)
+            self.db.add_firmware_version(self.target_tag)
             self.logger.info("Update completed successfully")
             self.cleanup_repository()
             return True
@@ -127,17 +227,16 @@ class FirmwareUpdater:
     def cleanup_repository(self) -> bool:
         """Clean up unnecessary objects from the repository to free up space."""
         self.logger.info("Starting repository cleanup")
+        git_dir = os.path.join(self.repo_path, '.git')
+        try:
+            before_size = _dir_size(git_dir)
+        except OSError:
+            before_size = None
 
-        # Remove loose objects that are no longer referenced
-        _, prune_success = run_command(['git', 'prune', '--expire', 'now'])
-        if not prune_success:
-            self.logger.error("Failed to prune loose objects")
-            return False
-
-        # Run garbage collection aggressively
+        # Run garbage collection, which also prunes loose unreferenced objects.  Not --aggressive:
+        # rewriting every pack takes minutes and wears the flash for little size benefit.
         _, gc_success = run_command([
             'git', 'gc',
-            '--aggressive',  # More thorough but slower GC
             '--prune=now',  # Remove all unreachable objects immediately
             '--quiet'  # Reduce output for embedded systems
         ])
@@ -145,12 +244,12 @@ class FirmwareUpdater:
             self.logger.error("Failed to run garbage collection")
             return False
 
-        # Calculate space saved (if du command is available)
+        # Calculate space saved
         try:
-            before_size = subprocess.check_output(['du', '-sh', '.git'], cwd=self.repo_path).split()[0]
-            after_size = subprocess.check_output(['du', '-sh', '.git'], cwd=self.repo_path).split()[0]
-            self.logger.info(f"Repository size changed from {before_size} to {after_size}")
-        except subprocess.CalledProcessError:
+            after_size = _dir_size(git_dir)
+            if before_size is not None:
+                self.logger.info(f"Repository size changed from {before_size / 1e6:.1f}MB to {after_size / 1e6:.1f}MB")
+        except OSError:
             self.logger.debug("Could not calculate repository size difference")
 
         self.logger.info("Repository cleanup completed")
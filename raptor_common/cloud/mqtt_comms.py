@@ -1,9 +1,15 @@
-import json
 import aiomqtt
 import asyncio
+import logging
+import orjson
+import random
+import socket
 import time
 import uuid
-from typing import AsyncGenerator, Optional, Dict, Any
+import weakref
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncGenerator, Optional, Dict, Any, Tuple, Deque
 from raptor_common.config.telemetry_config import TelemetryConfig
 from raptor_common.config.mqtt_config import MQTTConfig
 from raptor_common.database.database_manager import DatabaseManager
@@ -12,44 +18,432 @@ from logging import Logger
 from raptor_common.utils import JSON
 
 
-# Track last connection attempt time and backoff parameters
-_last_connection_attempt = 0
-_connection_failures = 0
-_max_backoff_seconds = 300  # Maximum backoff of 5 minutes
+# Per-process client id suffix for the command/response client
+_CLIENT_ID_SUFFIX = uuid.uuid4().hex[:8]
+# Failures beyond this no longer grow the exponent (2^10 is already past the cap)
+_max_backoff_exponent = 10
+# CONNACK codes retrying can't fix: bad username/password, not authorized (MQTT 3.1.1 and 5)
+_unrecoverable_connack_codes = frozenset({4, 5, 134, 135})
+# json.dumps (used before orjson) accepted int and other non-str dict keys; payloads still carry them
+_dumps_option = orjson.OPT_NON_STR_KEYS
+# After an unrecoverable error, try once more at this interval in case the broker side was fixed
+_unrecoverable_retry_s = 900.0
 
 
 def topic_path(telemetry_config: TelemetryConfig, topic: str) -> str:
     return f"{telemetry_config.root_path}{topic}"
 
 
-def _get_backoff_time() -> float:
-    """Calculate exponential backoff time based on connection failures"""
-    global _connection_failures
-    if _connection_failures == 0:
-        return 0
-
-    # Exponential backoff: 2^n seconds, capped at max_backoff_seconds
-    backoff = min(2 ** _connection_failures, _max_backoff_seconds)
-    return backoff
-
-
-async def _should_attempt_connection() -> bool:
-    """Determine if we should attempt a connection based on backoff strategy"""
-    global _last_connection_attempt, _connection_failures
-
-    # If never attempted or no failures, always try
-    if _last_connection_attempt == 0 or _connection_failures == 0:
-        return True
+@dataclass
+class BackoffPolicy:
+    """Exponential backoff with jitter for connection attempts to one broker endpoint"""
+    failures: int = 0
+    last_attempt: float = 0
+    base: float = 1.0
+    cap: float = 300  # Maximum backoff of 5 minutes
+    jitter: float = 0.5  # Randomise each delay by +/-50% so a fleet doesn't reconnect in lock-step
+    delay: float = 0
+
+    def next_delay(self) -> float:
+        """Backoff time chosen after the last failure"""
+        return self.delay if self.failures else 0
+
+    def remaining(self) -> float:
+        """Seconds left before another attempt is allowed"""
+        if self.last_attempt == 0 or self.failures == 0:
+            return 0
+        return max(self.delay - (time.time() - self.last_attempt), 0)
+
+    def should_attempt(self) -> bool:
+        return self.remaining() == 0
+
+    def record_attempt(self):
+        self.last_attempt = time.time()
+
+    def record_success(self):
+        self.failures = 0
+        self.delay = 0
+
+    def record_failure(self) -> float:
+        """Count a failure and pick the next delay: base * 2^n, capped, with random jitter"""
+        self.failures += 1
+        exponent = min(self.failures, _max_backoff_exponent)
+        backoff = min(self.base * 2 ** exponent, self.cap)
+        self.delay = backoff * (1 + random.uniform(-self.jitter, self.jitter))
+        return self.delay
+
+
+# One backoff policy per broker endpoint and user, so connections to independent brokers
+# (or as different users) never share failure counts
+_backoff_policies: Dict[Tuple[str, int, str], BackoffPolicy] = {}
+
+
+def get_backoff_policy(mqtt_config: MQTTConfig) -> BackoffPolicy:
+    key = (mqtt_config.broker, mqtt_config.port, mqtt_config.username)
+    policy = _backoff_policies.get(key)
+    if policy is None:
+        policy = _backoff_policies[key] = BackoffPolicy()
+    return policy
+
+
+def action_response_topic(response_topic: str, action_id: str) -> str:
+    """Command responses are published on a per-action subtopic so each requester only receives its own"""
+    return f"{response_topic}/{action_id}"
+
+
+def _is_topic_level(action_id: Any) -> bool:
+    """An action_id can only name a subtopic if it is a single, wildcard-free topic level"""
+    return isinstance(action_id, str) and bool(action_id) and not any(c in action_id for c in '+#/')
+
+
+def _is_unrecoverable(error: Optional[BaseException]) -> bool:
+    """Auth failures and an unknown broker hostname will never succeed on retry"""
+    if isinstance(error, socket.gaierror):
+        return error.errno == socket.EAI_NONAME
+    if isinstance(error, aiomqtt.MqttCodeError):
+        rc = getattr(error.rc, "value", error.rc)
+        return rc in _unrecoverable_connack_codes
+    return False
+
+
+class MqttSession:
+    """
+    Long-lived MQTT connection shared by the message listener and all publishes, so subscribe
+    and publish multiplex over one TCP stream instead of paying a CONNECT per message.
+    Connection attempts are gated by the broker's BackoffPolicy.
+    Only a session that listens connects with the configured identifier (and persistent session);
+    until then it connects under a per-process identifier, so processes sharing the configuration
+    that only publish never take over the listener's connection.
+    """
+
+    def __init__(self, mqtt_config: MQTTConfig, logger: Logger, identifier: Optional[str] = None,
+                 clean_session: bool = False):
+        self.mqtt_config = mqtt_config
+        self.logger = logger
+        self._fixed_identifier = identifier
+        self.identifier = identifier or mqtt_config.client_id
+        self.clean_session = clean_session
+        self._client: Optional[aiomqtt.Client] = None
+        # Whether messages() has run, and whether the live client connected with the listener identity
+        self._listening = False
+        self._client_listening = False
+        self._connect_lock = asyncio.Lock()
+        self.backoff = get_backoff_policy(mqtt_config)
+        # Set when the broker rejected us in a way retrying can't fix
+        self._unrecoverable = False
+        self._unrecoverable_since = 0.0
+        self._config_reloaded = asyncio.Event()
+        _live_sessions.add(self)
+
+    async def __aenter__(self) -> 'MqttSession':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.disconnect()
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None
+
+    @property
+    def connection_failures(self) -> int:
+        return self.backoff.failures
+
+    @property
+    def unrecoverable(self) -> bool:
+        return self._unrecoverable_wait() > 0
+
+    def _unrecoverable_wait(self) -> float:
+        """Seconds until the next slow retry after an unrecoverable error, 0 when an attempt is allowed"""
+        if not self._unrecoverable:
+            return 0.0
+        return max(0.0, self._unrecoverable_since + _unrecoverable_retry_s - time.monotonic())
+
+    def mark_config_reloaded(self):
+        """Allow connection attempts again after an unrecoverable error"""
+        self._unrecoverable = False
+        self.backoff.record_success()
+        self._config_reloaded.set()
+
+    async def reconfigure(self, mqtt_config: MQTTConfig):
+        """
+        Switch the session to a new broker configuration in place.  The live client is dropped, so
+        the listener and later publishes reconnect with the new settings on this same session.
+        """
+        self.mqtt_config = mqtt_config
+        self.identifier = self._fixed_identifier or mqtt_config.client_id
+        self.backoff = get_backoff_policy(mqtt_config)
+        self.mark_config_reloaded()
+        await self.disconnect()
+
+    def get_backoff_time(self) -> float:
+        return self.backoff.next_delay()
+
+    def should_attempt_connection(self) -> bool:
+        """Determine if we should attempt a connection based on backoff strategy"""
+        return not self.unrecoverable and self.backoff.should_attempt()
+
+    async def connect(self) -> aiomqtt.Client:
+        """Connect to the broker if not already connected and return the live client"""
+        async with self._connect_lock:
+            if self._client is None:
+                listening = self._listening
+                self.backoff.record_attempt()
+                # Resolve the broker ourselves: aiomqtt re-raises connect errors as MqttError(...) from None,
+                # which drops the socket.gaierror needed to recognise an unknown hostname
+                await asyncio.get_running_loop().getaddrinfo(
+                    self.mqtt_config.broker, self.mqtt_config.port, type=socket.SOCK_STREAM)
+                client = aiomqtt.Client(
+                    hostname=self.mqtt_config.broker,
+                    port=self.mqtt_config.port,
+                    username=self.mqtt_config.username,
+                    password=self.mqtt_config.password,
+                    keepalive=self.mqtt_config.keepalive,
+                    identifier=self.identifier if listening else f"{self.identifier}-{_CLIENT_ID_SUFFIX}",
+                    clean_session=self.clean_session if listening else True
+                )
+                await client.__aenter__()
+                self._client = client
+                self._client_listening = listening
+                self._unrecoverable = False
+
+                if self.backoff.failures > 0:
+                    self.logger.info(f"MQTT connection restored after {self.backoff.failures} failed attempts")
+                    self.backoff.record_success()
+                else:
+                    self.logger.info(
+                        f"MQTT session connected to {self.mqtt_config.broker}:{self.mqtt_config.port}")
+            return self._client
 
-    # Calculate time since last attempt
-    current_time = time.time()
-    time_since_last_attempt = current_time - _last_connection_attempt
+    async def disconnect(self):
+        client, self._client = self._client, None
+        await self._close_client(client)
 
-    # Get required backoff time
-    backoff_time = _get_backoff_time()
+    async def publish(self, topic: str, payload: bytes, qos: int = 1):
+        client = None
+        try:
+            client = await self.connect()
+            await client.publish(topic=topic, payload=payload, qos=qos)
+        except (aiomqtt.MqttError, OSError) as e:
+            # Only transport failures drop the shared client; a rejected message (e.g. paho's
+            # ValueError for an invalid topic or oversized payload) leaves the connection alone
+            await self._connection_lost(client, e)
+            raise
+
+    async def messages(self, topic: str, qos: int = 1,
+                       subscribed: Optional[asyncio.Event] = None) -> AsyncGenerator:
+        """
+        Subscribe to topic and yield decoded JSON payloads, reconnecting with backoff.
+        The optional subscribed event is set once the subscription is in place.
+        """
+        self._listening = True
+        if self._client is not None and not self._client_listening:
+            # Connected for publishing only: reconnect under the listener identity
+            await self.disconnect()
+
+        while True:
+            paused = self._unrecoverable_wait()
+            if paused > 0:
+                self.logger.debug("MQTT listener paused until the configuration is reloaded")
+                try:
+                    await asyncio.wait_for(self._config_reloaded.wait(), paused)
+                except asyncio.TimeoutError:
+                    pass  # slow retry: the next iteration attempts one connection
+                continue
+
+            # Determine if we should attempt connection based on backoff
+            wait_time = 0 if self.connected else self.backoff.remaining()
+            if wait_time > 0:
+                wait_time = min(wait_time, 10)  # Cap at 10s for responsiveness
+                self.logger.debug(f"Waiting for backoff: {wait_time:.1f}s before next connection attempt")
+                await asyncio.sleep(wait_time)
+                continue
+
+            client = None
+            try:
+                client = await self.connect()
+                await client.subscribe(topic, qos=qos)
+                self.logger.info(f"MQTT listener established on topic: {topic}")
+                if subscribed is not None:
+                    subscribed.set()
 
-    # Return True if we've waited long enough
-    return time_since_last_attempt >= backoff_time
+                # Process messages as they arrive
+                async for message in client.messages:
+                    try:
+                        payload = orjson.loads(message.payload)
+                        yield payload
+                    except orjson.JSONDecodeError:
+                        self.logger.error(f"Received invalid JSON payload: {message.payload.decode()}")
+                    except Exception as e:
+                        self.logger.error(f"Error processing message: {e}")
+
+            except (aiomqtt.MqttError, OSError) as e:  # OSError: broker name resolution in connect()
+                await self._connection_lost(client, e)
+                # Brief pause before next iteration
+                await asyncio.sleep(1)
+
+            except Exception as e:
+                self.logger.error(f"Unexpected error in MQTT listener: {e}")
+                await self._connection_lost(client, e)
+                await asyncio.sleep(5)  # Longer pause for unexpected errors
+
+    async def _connection_lost(self, client: Optional[aiomqtt.Client], error: Exception):
+        """Drop the broken client so the next call reconnects, and advance the backoff"""
+        if client is not None:
+            if self._client is not client:
+                # Already dropped (reconfigure/disconnect, or another caller that recorded the failure)
+                return
+            self._client = None
+            await self._close_client(client)
+
+        if _is_unrecoverable(error):
+            self._unrecoverable = True
+            self._unrecoverable_since = time.monotonic()
+            self._config_reloaded.clear()
+            self.logger.error(f"Unrecoverable MQTT error: {error}. Not retrying until the configuration is "
+                              f"reloaded (or for {_unrecoverable_retry_s:.0f}s)")
+            return
+
+        backoff_time = self.backoff.record_failure()
+        failures = self.backoff.failures
+
+        # Log with different verbosity levels based on failure count
+        if failures < 10:
+            self.logger.warning(f"MQTT connection error: {error}. Will retry in {backoff_time:.1f}s")
+        elif failures % 10 == 0:  # Log less frequently after multiple failures
+            self.logger.error(
+                f"Still unable to connect to MQTT broker after {failures} attempts: {error}. "
+                f"Next retry in {backoff_time:.1f}s")
+
+    async def _close_client(self, client: Optional[aiomqtt.Client]):
+        if client is None:
+            return
+        try:
+            await client.__aexit__(None, None, None)
+        except Exception as e:
+            self.logger.debug(f"Error closing MQTT client: {e}")
+
+
+# Every session in this process (shared session, response router), for mark_config_reloaded
+_live_sessions: 'weakref.WeakSet[MqttSession]' = weakref.WeakSet()
+# Shared session created on first use and reused by the listener and all publishes
+_session: Optional[MqttSession] = None
+# Database manager built on first telemetry upload and reused afterwards
+_db: Optional[DatabaseManager] = None
+
+
+def _get_db() -> DatabaseManager:
+    global _db
+    if _db is None:
+        _db = DatabaseManager(EnvVars().db_path)
+    return _db
+
+
+async def get_mqtt_session(mqtt_config: MQTTConfig, logger: Logger) -> MqttSession:
+    """
+    Return the process wide MQTT session.  A changed broker configuration is applied to the existing
+    session in place, so a listener already iterating it reconnects with the new settings rather than
+    holding on to a stale session.
+    """
+    global _session
+    if _session is None:
+        _session = MqttSession(mqtt_config, logger)
+    elif _session.mqtt_config != mqtt_config:
+        await _session.reconfigure(mqtt_config)
+    return _session
+
+
+def mark_config_reloaded():
+    """Clear an unrecoverable error on every live session so each retries with the new configuration"""
+    for session in list(_live_sessions):
+        session.mark_config_reloaded()
+
+
+class ResponseRouter:
+    """
+    Holds one subscription to every action subtopic of a response topic on a persistent
+    MqttSession, and hands each command response to the caller waiting on its action_id.
+    Replaces a client, SUBSCRIBE and UNSUBSCRIBE per request with one subscription at startup.
+    The router's session is dedicated to it, so no other listener consumes its messages.
+    """
+
+    def __init__(self, session: MqttSession, response_topic: str):
+        self.session = session
+        self.response_topic = response_topic
+        self.pending: Dict[str, asyncio.Future] = {}
+        self._subscribed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the listener if needed and wait until the response subscription is active"""
+        if self._task is None or self._task.done():
+            self._subscribed.clear()
+            self._task = asyncio.create_task(self._run())
+        await self._subscribed.wait()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        await self.session.disconnect()
+
+    async def send_command(self, command_topic: str, message: Dict[str, Any], action_id: str,
+                           timeout_seconds: float) -> Optional[Dict[str, Any]]:
+        """Publish a command and wait for the response carrying its action_id"""
+        logger = self.session.logger
+        future = asyncio.get_running_loop().create_future()
+        self.pending[action_id] = future
+        try:
+            async with asyncio.timeout(timeout_seconds):
+                await self.start()
+
+                payload = orjson.dumps(message, option=_dumps_option)
+                await self.session.publish(command_topic, payload, qos=1)
+                logger.info(f"Published command to topic: {command_topic}")
+                logger.info(f"Payload {payload.decode()}")
+
+                return await future
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout waiting for response to action_id: {action_id}")
+            return None
+        finally:
+            if self.pending.get(action_id) is future:
+                del self.pending[action_id]
+
+    async def _run(self):
+        topic = action_response_topic(self.response_topic, '+')
+        async for response_data in self.session.messages(topic, qos=1, subscribed=self._subscribed):
+            action_id = response_data.get('action_id') if isinstance(response_data, dict) else None
+            future = self.pending.pop(action_id, None)
+            if future is not None and not future.done():
+                future.set_result(response_data)
+            elif self.session.logger.isEnabledFor(logging.DEBUG):
+                self.session.logger.debug(f"No pending command for response action_id: {action_id}")
+
+
+# Shared router used by send_message_and_wait_for_response
+_router: Optional[ResponseRouter] = None
+
+
+async def get_response_router(mqtt_config: MQTTConfig, response_topic: str, logger: Logger) -> ResponseRouter:
+    """Return the process wide response router, replacing it if the broker or topic changed"""
+    global _router
+    if (_router is None or _router.session.mqtt_config != mqtt_config or
+            _router.response_topic != response_topic):
+        if _router is not None:
+            await _router.stop()
+        session = MqttSession(mqtt_config, logger, identifier=f"raptor-mqtt-ui-{_CLIENT_ID_SUFFIX}",
+                              clean_session=True)
+        _router = ResponseRouter(session, response_topic)
+    return _router
 
 
 async def send_message_and_wait_for_response(
@@ -60,206 +454,164 @@ async def send_message_and_wait_for_response(
         action_id: str,
         timeout_seconds: int = 30, logger = None
 ) -> Optional[Dict[str, Any]]:
-    """Send MQTT message and wait for response with matching action_id"""
-
+    """Send MQTT message and wait for the response published on its action_id subtopic"""
     try:
-        async with aiomqtt.Client(
-                hostname=mqtt_config.broker,
-                port=mqtt_config.port,
-                username=mqtt_config.username,
-                password=mqtt_config.password,
-                keepalive=60,
-                identifier=f"raptor-mqtt-ui-{uuid.uuid4().hex[:8]}"
-        ) as client:
+        router = await get_response_router(mqtt_config, response_topic, logger)
+        session = router.session
+        if session.unrecoverable or (not session.connected and not session.should_attempt_connection()):
+            logger.warning(f"Skipping MQTT command due to backoff (waiting for {session.get_backoff_time():.1f}s)")
+            return None
 
-            # Subscribe to response topic first
-            await client.subscribe(response_topic)
-            logger.info(f"Subscribed to response topic: {response_topic}")
-
-            # Send the command message
-            payload = json.dumps(message)
-            await client.publish(command_topic, payload, qos=1)
-            logger.info(f"Published command to topic: {command_topic}")
-            logger.info(f"Payload {payload}")
-
-            # Wait for response with timeout
-            try:
-                async with asyncio.timeout(timeout_seconds):
-                    async for mqtt_message in client.messages:
-                        try:
-                            # Parse the response
-                            print(mqtt_message)
-                            response_data = json.loads(mqtt_message.payload.decode())
-                            logger.info(response_data)
-                            # Check if this response matches our action_id
-                            response_action_id = response_data.get('action_id') or response_data.get('action_id')
-
-                            if response_action_id == action_id:
-                                logger.info(f"Received matching response for action_id: {action_id}")
-                                return response_data
-                            else:
-                                logger.debug(
-                                    f"Received response for different action_id: {response_action_id}, expected: {action_id}")
-
-                        except json.JSONDecodeError as e:
-                            logger.warning(f"Received invalid JSON response: {mqtt_message.payload.decode()}")
-                        except Exception as e:
-                            logger.error(f"Error processing response message: {e}")
-
-            except asyncio.TimeoutError:
-                logger.warning(f"Timeout waiting for response to action_id: {action_id}")
-                return None
+        return await router.send_command(command_topic, message, action_id, timeout_seconds)
 
     except Exception as e:
         logger.error(f"Error in send_message_and_wait_for_response: {e}")
         return None
 
-async def publish_payload(mqtt_config: MQTTConfig, topic: str, payload: JSON, logger: Logger) -> bool:
-    """Publish payload to MQTT broker with backoff strategy"""
-    global _last_connection_attempt, _connection_failures
 
-    # Check if we should attempt connection based on backoff strategy
-    if not await _should_attempt_connection():
-        logger.info(f"Skipping MQTT connection attempt due to backoff (waiting for {_get_backoff_time()}s)")
+async def publish_payload(mqtt_config: MQTTConfig, topic: str, payload: bytes, logger: Logger,
+                          session: Optional[MqttSession] = None) -> bool:
+    """Publish serialised payload bytes to MQTT broker over the shared session with backoff strategy"""
+    if session is None:
+        session = await get_mqtt_session(mqtt_config, logger)
+
+    if session.unrecoverable:
+        logger.debug("Skipping MQTT publish until the configuration is reloaded")
         return False
 
-    # Update last connection attempt time
-    _last_connection_attempt = time.time()
+    # Check if we should attempt connection based on backoff strategy
+    if not session.connected and not session.should_attempt_connection():
+        logger.info(f"Skipping MQTT connection attempt due to backoff (waiting for {session.get_backoff_time():.1f}s)")
+        return False
 
     try:
-        async with aiomqtt.Client(
-                hostname=mqtt_config.broker,
-                port=mqtt_config.port,
-                username=mqtt_config.username,
-                password=mqtt_config.password
-        ) as client:
-            # Publish to telemetry topic
-            await client.publish(topic=topic, payload=payload.encode(), qos=1)
-
-        # Reset connection failures on success
-        if _connection_failures > 0:
-            logger.info(f"MQTT connection restored after {_connection_failures} failed attempts")
-            _connection_failures = 0
-
+        await session.publish(topic, payload, qos=1)
         return True
+    except (aiomqtt.MqttError, OSError) as e:
+        # The session has already recorded the failure for backoff
+        logger.debug(f"Error publishing to MQTT broker: {e}")
+        return False
     except Exception as e:
-        # Increment connection failures
-        _connection_failures += 1
-        backoff_time = _get_backoff_time()
-
-        # Log with different levels based on failure count
-        if _connection_failures == 1:
-            logger.warning(f"Error communicating to MQTT broker: {e}. Will retry in {backoff_time}s")
-        elif _connection_failures % 10 == 0:  # Log only every 10 failures to reduce log spam
-            logger.error(
-                f"Still unable to connect to MQTT broker after {_connection_failures} attempts: {e}. Next retry in {backoff_time}s")
-
+        logger.error(f"MQTT publish to {topic} rejected: {e}")
         return False
 
 
 async def upload_telemetry_data_mqtt(mqtt_config: MQTTConfig, telemetry_config: TelemetryConfig,
-                                     logger: Logger) -> bool:
+                                     logger: Logger, session: Optional[MqttSession] = None,
+                                     db: Optional[DatabaseManager] = None) -> bool:
     """Upload telemetry data with backoff strategy"""
     try:
-        db = DatabaseManager(EnvVars().db_path)
+        if db is None:
+            db = _get_db()
         payload = db.get_stored_telemetry_data()
-        payload = json.dumps(payload)
-        return await publish_payload(mqtt_config, telemetry_config.telemetry_topic, payload, logger)
+        payload = orjson.dumps(payload, option=_dumps_option)
+        return await publish_payload(mqtt_config, telemetry_config.telemetry_topic, payload, logger, session)
     except Exception as e:
         logger.error(f"Error uploading telemetry data: {e}")
         return False
 
 
-async def setup_mqtt_listener(mqtt_config: MQTTConfig,
-                              telemetry_config: TelemetryConfig,
-                              logger: Logger) -> AsyncGenerator:
-    """Set up a persistent MQTT connection with proper backoff and yield messages"""
-    # Track connection attempts for backoff
-    connection_failures = 0
-    last_connection_attempt = 0
-    max_backoff = 300  # 5 minutes max backoff
-
-    while True:
-        current_time = time.time()
-
-        # Calculate backoff time based on failures
-        backoff_time = 0
-        if connection_failures > 0:
-            backoff_time = min(2 ** connection_failures, max_backoff)
-
-        # Determine if we should attempt connection based on backoff
-        time_since_last_attempt = current_time - last_connection_attempt
-        if last_connection_attempt > 0 and time_since_last_attempt < backoff_time:
-            wait_time = min(backoff_time - time_since_last_attempt, 10)  # Cap at 10s for responsiveness
-            logger.debug(f"Waiting for backoff: {wait_time:.1f}s before next connection attempt")
-            await asyncio.sleep(wait_time)
-            continue
-
-        # Update last attempt time
-        last_connection_attempt = current_time
-
-        try:
-            # Use context manager for MQTT client connection
-            async with aiomqtt.Client(
-                    hostname=mqtt_config.broker,
-                    port=mqtt_config.port,
-                    username=mqtt_config.username,
-                    password=mqtt_config.password,
-                    keepalive=mqtt_config.keepalive,
-                    identifier=mqtt_config.client_id,
-                    clean_session=False
-            ) as client:
-                # Subscribe to the messages topic
-                await client.subscribe(telemetry_config.messages_topic, qos=1, retain=True)
-
-                # Log successful connection (with reconnection info if applicable)
-                if connection_failures > 0:
-                    logger.info(f"MQTT connection restored after {connection_failures} failed attempts")
-                    connection_failures = 0
-                else:
-                    logger.info(f"MQTT listener established on topic: {telemetry_config.messages_topic}")
-
-                # Process messages as they arrive
-                async for message in client.messages:
-                    try:
-                        payload = json.loads(message.payload.decode())
-                        yield payload
-                    except json.JSONDecodeError:
-                        logger.error(f"Received invalid JSON payload: {message.payload.decode()}")
-                    except Exception as e:
-                        logger.error(f"Error processing message: {e}")
-
-        except aiomqtt.MqttError as e:
-            # Increment connection failures for backoff calculation
-            connection_failures += 1
-            backoff_time = min(2 ** connection_failures, max_backoff)
+class MqttTelemetryUploader:
+    """
+    Buffers telemetry samples and publishes them as one payload per flush interval (or as soon
+    as max_batch samples are waiting), amortising the QoS 1 round-trip over the whole batch.
+    """
+
+    def __init__(self, mqtt_config: MQTTConfig, telemetry_config: TelemetryConfig, logger: Logger,
+                 session: Optional[MqttSession] = None, flush_interval_s: float = 5.0,
+                 max_batch: int = 100, max_buffered: int = 10000):
+        self.mqtt_config = mqtt_config
+        self.topic = telemetry_config.telemetry_topic
+        self.logger = logger
+        self.session = session
+        self.flush_interval_s = flush_interval_s
+        self.max_batch = max_batch
+        # Bounded so a long broker outage can't exhaust memory.  Overflow policy: the newest samples are
+        # kept and the oldest dropped, both on enqueue and when a failed batch is put back
+        self._buffer: Deque[JSON] = deque(maxlen=max_buffered)
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, sample: JSON):
+        """Queue a telemetry sample for the next batched publish"""
+        self._buffer.append(sample)
+        if len(self._buffer) >= self.max_batch:
+            self._flush_requested.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flush task and publish anything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> bool:
+        if not self._buffer:
+            return True
 
-            # Log with different verbosity levels based on failure count
-            if connection_failures < 10:
-                logger.warning(f"MQTT connection error: {e}. Will retry in {backoff_time}s")
-            elif connection_failures % 10 == 0:  # Log less frequently after multiple failures
-                logger.error(
-                    f"Still unable to connect to MQTT broker after {connection_failures} attempts: {e}. Next retry in {backoff_time}s")
+        batch = list(self._buffer)
+        # Serialize before clearing: a sample orjson rejects must not take the whole buffer with it
+        payload = orjson.dumps(batch, option=_dumps_option)
+        self._buffer.clear()
+        success = await publish_payload(self.mqtt_config, self.topic, payload, self.logger, self.session)
+        if not success:
+            # Put the batch back ahead of anything enqueued during the publish; extend() on the bounded
+            # deque drops from the left, so an overflow loses the oldest samples rather than the newest
+            newer = list(self._buffer)
+            dropped = len(batch) + len(newer) - self._buffer.maxlen
+            if dropped > 0:
+                self.logger.warning(f"Telemetry buffer full, dropping {dropped} oldest samples")
+            self._buffer.clear()
+            self._buffer.extend(batch)
+            self._buffer.extend(newer)
+        return success
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
 
-            # Brief pause before next iteration
-            await asyncio.sleep(1)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f"Error flushing telemetry batch: {e}")
 
-        except Exception as e:
-            # Handle any other exceptions with backoff
-            connection_failures += 1
-            backoff_time = min(2 ** connection_failures, max_backoff)
 
-            logger.error(f"Unexpected error in MQTT listener: {e}")
-            await asyncio.sleep(5)  # Longer pause for unexpected errors
+async def setup_mqtt_listener(mqtt_config: MQTTConfig,
+                              telemetry_config: TelemetryConfig,
+                              logger: Logger) -> AsyncGenerator:
+    """Listen on the shared MQTT session (with proper backoff) and yield messages"""
+    session = await get_mqtt_session(mqtt_config, logger)
+    async for payload in session.messages(telemetry_config.messages_topic, qos=1):
+        yield payload
 
 
 async def upload_command_response(mqtt_config: MQTTConfig, telemetry_config: TelemetryConfig,
-                                  payload: JSON, logger: Logger) -> bool:
-    """Upload command response with backoff strategy"""
+                                  payload: JSON, logger: Logger, session: Optional[MqttSession] = None) -> bool:
+    """Upload command response, on its action_id subtopic when present, with backoff strategy"""
     try:
-        payload_str = json.dumps(payload)
-        logger.info(f"Command response: {payload_str}")
-        return await publish_payload(mqtt_config, telemetry_config.response_topic, payload_str, logger)
+        topic = telemetry_config.response_topic
+        action_id = payload.get('action_id') if isinstance(payload, dict) else None
+        if _is_topic_level(action_id):
+            topic = action_response_topic(topic, action_id)
+        elif action_id:
+            # The action_id comes from the remote side: never let it add wildcards or levels to our topic
+            logger.warning(f"action_id {action_id!r} is not a valid topic level, responding on {topic}")
+
+        payload_bytes = orjson.dumps(payload, option=_dumps_option)
+        logger.info(f"Command response: {payload_bytes.decode()}")
+        return await publish_payload(mqtt_config, topic, payload_bytes, logger, session)
     except Exception as e:
         logger.error(f"Error uploading command response: {e}")
         return False
@@ -267,6 +619,12 @@ async def upload_command_response(mqtt_config: MQTTConfig, telemetry_config: Tel
 
 async def check_connection(mqtt_config: MQTTConfig, logger: Logger) -> bool:
     """Check MQTT connection status by attempting a quick connection test"""
+    backoff = get_backoff_policy(mqtt_config)
+    if not backoff.should_attempt():
+        logger.info(f"Skipping MQTT connection check due to backoff (waiting for {backoff.next_delay():.1f}s)")
+        return False
+
+    backoff.record_attempt()
     try:
         # Quick connection test with short timeout
         async with aiomqtt.Client(
@@ -280,14 +638,18 @@ async def check_connection(mqtt_config: MQTTConfig, logger: Logger) -> bool:
             # Simple ping test - subscribe to a test topic briefly
             await client.subscribe("$SYS/broker/uptime")  # Standard MQTT broker topic
             logger.info("Successfully connected and ping'd.")
+            backoff.record_success()
             return True
     except  asyncio.TimeoutError:
+        backoff.record_failure()
         logger.warning(f"MQTT connection test timed out after 5 seconds")
         return False
     except ConnectionRefusedError:
+        backoff.record_failure()
         logger.warning(f"MQTT connection refused - check broker address and port")
         return False
     except Exception as e:
+        backoff.record_failure()
         error_msg = str(e)
         logger.warning(f"MQTT connection check failed: {error_msg}")
         return False
@@ -1,5 +1,7 @@
 from typing import Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sqlite3
 
 from utils import EnvVars
@@ -14,10 +16,20 @@ class RaptorCommissioner:
 
     def __init__(self):
         self.logger = LogManager().get_logger("RaptorCommissioner")
-        self.api_base_url = EnvVars().api_url
+        self.env = EnvVars()
+        self.api_base_url = self.env.api_url
         self.api_key: Optional[str] = None
         self.mac_address = get_mac_address()
 
+        # Pooled keep-alive session; transient server errors are retried by urllib3 with
+        # exponential backoff.  POST is safe to retry since commissioning is keyed by MAC address.
+        self._session = requests.Session()
+        self._session.headers.update({'Accept': 'application/json'})
+        retries = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504],
+                        allowed_methods=frozenset({'POST'}))
+        self._session.mount('https://', HTTPAdapter(pool_maxsize=4, max_retries=retries))
+        self._session.mount('http://', HTTPAdapter(pool_maxsize=4, max_retries=retries))
+
 
     def commission(self):
         if self.api_key:
@@ -31,40 +43,28 @@ class RaptorCommissioner:
 
             self.logger.info(f"Attempting to commission Raptor with MAC: {self.mac_address}")
             self.logger.info(f"Using: {url} and payload: {payload}")
-            response = requests.post(url, json=payload)
+            response = self._session.post(url, json=payload, timeout=(5, 30))
 
             if response.status_code == 200:
                 self.logger.info("Successfully got response.")
                 data = response.json()
                 self.api_key = data.get('api_key')
-                envvars = EnvVars()
                 raptor_id = data.get('raptor_id')
                 firmware_tag = data.get('firmware_tag')
-                db = DatabaseManager(envvars.db_path)
+                db = DatabaseManager(self.env.db_path)
 
                 try:
                     with db.connection as conn:
                         conn.execute("""
-                        UPDATE commission 
-                        SET api_key = ?, firmware_tag = ?
-                        WHERE raptor_id = ?
-                        """, (self.api_key, firmware_tag, raptor_id))
-
-                        # If no rows were updated, insert a new row
-                        if conn.total_changes == 0:
-                            conn.execute("""
-                            INSERT INTO commission (raptor_id, api_key, firmware_tag)
-                            VALUES (?, ?, ?)
-                            """, (raptor_id, self.api_key, firmware_tag))
+                        INSERT INTO commission (raptor_id, api_key, firmware_tag)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(raptor_id) DO UPDATE SET
+                            api_key = excluded.api_key,
+                            firmware_tag = excluded.firmware_tag
+                        """, (raptor_id, self.api_key, firmware_tag))
                 except sqlite3.Error as e:
                     self.logger.error(f"Database error: {e}")
 
-                # with db.connection as conn:
-                #     conn.execute("""
-                #     REPLACE INTO commission (raptor_id, api_key, firmware_tag)
-                #         VALUES (?, ?, ?)
-                #     """, (raptor_id, self.api_key, firmware_tag))
-                #     conn.commit()
                 self.logger.info("Successfully commissioned Raptor", self.api_key, firmware_tag)
                 return True
             else:
@@ -1,12 +1,19 @@
-from typing import Optional, Dict, Any
-import json
-import jsonschema
-import requests
+from typing import TYPE_CHECKING, Callable, Optional, Dict, Any
+import functools
+import hashlib
+import orjson
+import sys
 from utils import EnvVars, get_mac_address
 from utils import LogManager
 from database.db_utils import get_api_key
 from database.database_manager import DatabaseManager
 
+if TYPE_CHECKING:
+    import requests
+
+# requests and fastjsonschema are imported on first use: most processes importing this module never
+# fetch or validate a configuration, and the imports are a noticeable part of cold start on the device.
+
 
 class RaptorConfiguration:
     SCHEMA = {
@@ -44,16 +51,44 @@ class RaptorConfiguration:
     def __init__(self):
         self.logger = LogManager().get_logger("RaptorConfiguration")
 
-        self.api_base_url = EnvVars().api_url
+        self.env = EnvVars()
+        self.api_base_url = self.env.api_url
         self.api_key: Optional[str] = get_api_key(self.logger)
         self.mac_address = get_mac_address()
+        self._db = DatabaseManager(self.env.db_path)
+        self._session: Optional['requests.Session'] = None
+
+
+    def _get_session(self) -> 'requests.Session':
+        """Pooled keep-alive session so repeated configuration polls reuse the TCP/TLS connection"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            self._session = requests.Session()
+            retries = Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+            self._session.headers['Accept-Encoding'] = 'gzip'
+            if self.api_key:
+                self._session.headers['X-API-Key'] = self.api_key
+        return self._session
 
 
     def validate_json(self, data: Dict[str, Any]) -> bool:
+        # Cheap rejection of payloads missing a top-level section before the full schema walk
+        if not isinstance(data, dict) or not _REQUIRED_TOP.issubset(data):
+            missing = sorted(_REQUIRED_TOP.difference(data)) if isinstance(data, dict) else sorted(_REQUIRED_TOP)
+            self.logger.error(f"Configuration data validation error: missing sections {missing}")
+            self.logger.error(f"GOT:      {data}")
+            return False
+        import fastjsonschema
         try:
-            jsonschema.validate(instance=data, schema=RaptorConfiguration.SCHEMA)
+            _get_validator()(data)
             return True
-        except jsonschema.exceptions.ValidationError as e:
+        except fastjsonschema.JsonSchemaException as e:
             self.logger.error(f"Configuration data validation error: {e}")
             self.logger.error(f"EXPECTED: {RaptorConfiguration.SCHEMA}")
             self.logger.error(f"GOT:      {data}")
@@ -68,57 +103,91 @@ class RaptorConfiguration:
 
         try:
             url = f"{self.api_base_url}/api/v2/raptor/configuration"
-            headers = {'X-API-Key': self.api_key}
             params = {'mac_address': self.mac_address}
 
             self.logger.info("Fetching configuration")
-            response = requests.get(url, headers=headers, params=params)
-
-            if response.status_code == 200:
-                config = response.json()
-                self.logger.info("Successfully retrieved configuration")
-                self.save_configuration(config)
-                return config
-            else:
-                self.logger.error(f"Configuration fetch failed: {response.text}")
-                raise ValueError(f"Response code from CREM3 configuration API: {response.status_code}")
+            # Stream the body and hand the (gzip-decoded) bytes straight to orjson, skipping
+            # requests' charset detection and stdlib json parsing
+            with self._get_session().get(url, params=params, timeout=(3.05, 10), stream=True) as response:
+                if response.status_code != 200:
+                    self.logger.error(f"Configuration fetch failed: {response.text}")
+                    raise ValueError(f"Response code from CREM3 configuration API: {response.status_code}")
+                config = orjson.loads(response.raw.read(decode_content=True))
+
+            self.logger.info("Successfully retrieved configuration")
+            self.save_configuration(config)
+            return config
 
         except Exception as e:
             self.logger.error(f"Configuration error: {e}")
             raise
 
 
-    def save_configuration(self, config_data: Dict[str, Any], filename: Optional[str] = None):
-        """ Clear the existing configuration data.  Keep the telemetry data in case of roll back? """
-
-        """Save configuration to the SQLite database"""
-
+    def _store_configuration(self, config_data: Dict[str, Any], config_hash: str):
+        """Validate and replace the configuration (and its hash) stored in the SQLite database"""
         # Validate
         if not self.validate_json(config_data):
             self.logger.error("Did not validate the configuration data.")
             raise ValueError(f"Invalid Raptor Configuration")
         try:
             # Extract MQTT and telemetry config
-            mqtt_config = json.dumps(config_data["mqtt"])
-            telemetry_config = json.dumps(config_data["telemetry"])
+            mqtt_config = orjson.dumps(config_data["mqtt"]).decode()
+            telemetry_config = orjson.dumps(config_data["telemetry"]).decode()
             raptor = config_data["raptor"]
-            db = DatabaseManager(EnvVars().db_path)
-            db.clear_existing_configuration()
-            db.update_telemetry(telemetry_config, mqtt_config)
-            db.add_hardware(config_data['hardware'])
-            db.add_raptor_id(raptor)
+            # Replace the configuration atomically, committing once for all writes
+            with self._db.transaction():
+                self._db.clear_existing_configuration()
+                self._db.update_telemetry(telemetry_config, mqtt_config)
+                self._db.add_hardware(config_data['hardware'])
+                self._db.add_raptor_id(raptor)
+                self._db.set_configuration_hash(config_hash)
         except Exception as e:
             self.logger.error(f"Unable to save configuration: {config_data}")
             self.logger.error(f"Error: {e}")
             raise
 
+
+    def save_configuration(self, config_data: Dict[str, Any], filename: Optional[str] = None):
+        """ Clear the existing configuration data.  Keep the telemetry data in case of roll back? """
+
+        """Save configuration to the SQLite database"""
+
+        # Polling usually returns the same configuration; skip the validate + DB rewrite when unchanged.
+        # The hash lives in the database next to the configuration, so a rebuilt, cleared or restored
+        # database never matches a stale in-process value
+        config_hash = hashlib.blake2b(orjson.dumps(config_data, option=orjson.OPT_SORT_KEYS),
+                                      digest_size=16).hexdigest()
+        if config_hash == self._db.get_configuration_hash():
+            self.logger.info("Configuration unchanged, not rewriting the database")
+        else:
+            self._store_configuration(config_data, config_hash)
+            _notify_configuration_reloaded()
+
         if filename:
             """Save configuration to a file"""
             try:
-                with open(filename, 'w') as f:
-                    json.dump(config_data, f, indent=2)
+                with open(filename, 'wb') as f:
+                    f.write(orjson.dumps(config_data, option=orjson.OPT_INDENT_2))
                 self.logger.info(f"Configuration saved to {filename}")
                 return True
             except Exception as e:
                 self.logger.error(f"Failed to save configuration: {str(e)}")
                 raise
+
+
+def _notify_configuration_reloaded():
+    """Let MQTT sessions paused on an unrecoverable error (e.g. bad credentials) retry with the new configuration"""
+    # Only a process that already loaded the MQTT module can hold live sessions; don't import it (and aiomqtt) here
+    mqtt_comms = sys.modules.get('raptor_common.cloud.mqtt_comms')
+    if mqtt_comms is not None:
+        mqtt_comms.mark_config_reloaded()
+
+
+@functools.cache
+def _get_validator() -> Callable[[Any], Any]:
+    """The schema is static: compile it into a specialised validation function once, on first use"""
+    import fastjsonschema
+    return fastjsonschema.compile(RaptorConfiguration.SCHEMA)
+
+
+_REQUIRED_TOP = frozenset(RaptorConfiguration.SCHEMA["required"])
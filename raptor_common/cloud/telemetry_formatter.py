@@ -5,12 +5,13 @@ Provides common formatting functions for MQTT and other telemetry protocols
 """
 
 import time
-from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional
 from dataclasses import dataclass, asdict
 from config.mqtt_config import FORMAT_LINE_PROTOCOL, FORMAT_FLAT, FORMAT_HIER
 
 
-@dataclass
+@dataclass(slots=True)
 class TelemetryPoint:
     """Standard telemetry data point structure"""
     measurement: str
@@ -22,7 +23,49 @@ class TelemetryPoint:
 
     def __post_init__(self):
         if self.timestamp is None:
-            self.timestamp = int(time.time() * 1000000000)  # nanosecond precision
+            self.timestamp = time.time_ns()  # nanosecond precision
+
+
+_NUMERIC_TYPES = (int, float, bool)
+# String values treated as missing; none is longer than 4 characters
+_EMPTY_SENTINELS = frozenset({'none', 'null', ''})
+
+
+@lru_cache(maxsize=512, typed=True)
+def _id_str(x: Any) -> str:
+    """str() of a hardware/device/actuator id; ids repeat every polling cycle so reuse the string"""
+    return str(x)
+
+
+# Line protocol requires spaces, commas and equals signs in tag keys/values and field keys to be escaped
+_TAG_ESCAPE = str.maketrans({" ": "\\ ", ",": "\\,", "=": "\\="})
+
+
+@lru_cache(maxsize=512, typed=True)
+def _esc_tag(s: str) -> str:
+    """Escape a tag key, tag value or field key; repeated names are served from the cache"""
+    return str(s).translate(_TAG_ESCAPE)
+
+
+_TRUE = "true"
+_FALSE = "false"
+
+
+def _format_value(value: Any) -> str:
+    """Format a single line protocol field value"""
+    # Booleans are checked by identity first: bool is an int subclass and needs its own rendering
+    if value is True:
+        return _TRUE
+    if value is False:
+        return _FALSE
+    if isinstance(value, str):
+        return '"' + value + '"'
+    return str(value)
+
+
+def _format_field(key: str, value: Any) -> str:
+    """Format a single line protocol field"""
+    return _esc_tag(key) + "=" + _format_value(value)
 
 
 class TelemetryFormatter:
@@ -35,6 +78,17 @@ class TelemetryFormatter:
     def __init__(self, raptor_id: str, format_type: str = FORMAT_LINE_PROTOCOL):
         self.raptor_id = raptor_id
         self.format_type = format_type
+        # The raptor tag is invariant for the formatter, so build it once rather than per point
+        self._raptor_tag = f",raptor={_esc_tag(raptor_id)}"
+        # Resolve the formatter once; an unsupported format fails at construction rather than per call
+        dispatch = {
+            FORMAT_LINE_PROTOCOL: self.format_line_protocol,
+            FORMAT_HIER: self.format_hierarchical,
+            FORMAT_FLAT: self.format_flat
+        }
+        if format_type not in dispatch:
+            raise ValueError(f"Unsupported format type: {format_type}")
+        self._formatter = dispatch[format_type]
 
 
 
@@ -48,30 +102,57 @@ class TelemetryFormatter:
         Returns:
             List of line protocol formatted strings
         """
-        lines = []
+        fmt = _format_field
+        esc = _esc_tag
+        raptor_tag = self._raptor_tag
+        lines = [None] * len(telemetry_points)
 
-        for point in telemetry_points:
-            # Add raptor_id to tags
-            all_tags = {"raptor": self.raptor_id, **point.tags}
+        for i, point in enumerate(telemetry_points):
+            field_str = ",".join([fmt(k, v) for k, v in point.fields.items()])
+            if point.tags:
+                tag_str = ",".join([f"{esc(k)}={esc(v)}" for k, v in point.tags.items()])
+                lines[i] = f"{point.measurement}{raptor_tag},{tag_str} {field_str} {point.timestamp}"
+            else:
+                lines[i] = f"{point.measurement}{raptor_tag} {field_str} {point.timestamp}"
 
-            # Format tags
-            tag_str = ','.join([f"{k}={v}" for k, v in all_tags.items()])
+        return lines
 
-            # Format fields
-            field_strs = []
-            for key, value in point.fields.items():
-                if isinstance(value, str):
-                    field_strs.append(f'{key}="{value}"')
-                elif isinstance(value, bool):
-                    field_strs.append(f'{key}={str(value).lower()}')
-                else:
-                    field_strs.append(f'{key}={value}')
 
-            field_str = ','.join(field_strs)
 
-            # Create line protocol string
-            line = f"{point.measurement},{tag_str} {field_str} {point.timestamp}"
-            lines.append(line)
+    def format_line_protocol_batch(self, telemetry_points: List[TelemetryPoint]) -> List[str]:
+        """
+        Format a large batch of telemetry points as InfluxDB line protocol.  Points sharing a
+        schema (measurement, tag keys and field keys) are formatted together so the escaped
+        measurement/key prefixes are built once per schema instead of once per point.
+
+        Args:
+            telemetry_points: List of TelemetryPoint objects
+
+        Returns:
+            List of line protocol formatted strings, in the same order as the input
+        """
+        groups: Dict[tuple, List[int]] = {}
+        for i, point in enumerate(telemetry_points):
+            groups.setdefault((point.measurement, tuple(point.tags), tuple(point.fields)), []).append(i)
+
+        value = _format_value
+        esc = _esc_tag
+        lines = [None] * len(telemetry_points)
+
+        for (measurement, tag_keys, field_keys), indices in groups.items():
+            if len(indices) == 1:
+                # Nothing to share for a one-off schema
+                lines[indices[0]] = self.format_line_protocol([telemetry_points[indices[0]]])[0]
+                continue
+
+            head = measurement + self._raptor_tag
+            tag_prefixes = [f",{esc(k)}=" for k in tag_keys]
+            field_prefixes = [f"{esc(k)}=" for k in field_keys]
+            for i in indices:
+                point = telemetry_points[i]
+                tag_str = "".join([p + esc(v) for p, v in zip(tag_prefixes, point.tags.values())])
+                field_str = ",".join([p + value(v) for p, v in zip(field_prefixes, point.fields.values())])
+                lines[i] = f"{head}{tag_str} {field_str} {point.timestamp}"
 
         return lines
 
@@ -89,7 +170,7 @@ class TelemetryFormatter:
         """
         result = {
             "raptor_id": self.raptor_id,
-            "timestamp": int(time.time() * 1000),
+            "timestamp": time.time_ns() // 1_000_000,
             "measurements": {}
         }
 
@@ -121,7 +202,7 @@ class TelemetryFormatter:
         """
         result = {
             "raptor_id": self.raptor_id,
-            "timestamp": int(time.time() * 1000)
+            "timestamp": time.time_ns() // 1_000_000
         }
 
         for point in telemetry_points:
@@ -151,67 +232,66 @@ class TelemetryFormatter:
         Returns:
             Formatted data with mode and data fields
         """
-        if self.format_type == FORMAT_LINE_PROTOCOL:
-            return {
-                "mode": FORMAT_LINE_PROTOCOL,
-                "data": self.format_line_protocol(telemetry_points)
-            }
-        elif self.format_type == FORMAT_HIER:
-            return {
-                "mode": FORMAT_HIER,
-                "data": self.format_hierarchical(telemetry_points)
-            }
-        elif self.format_type == FORMAT_FLAT:
-            return {
-                "mode": FORMAT_FLAT,
-                "data": self.format_flat(telemetry_points)
-            }
-        else:
-            raise ValueError(f"Unsupported format type: {self.format_type}")
+        return {
+            "mode": self.format_type,
+            "data": self._formatter(telemetry_points)
+        }
 
 
-def create_system_telemetry_points(system_measurements: Dict[str, Any]) -> List[TelemetryPoint]:
+def iter_system_telemetry_points(system_measurements: Dict[str, Any]) -> Iterator[TelemetryPoint]:
     """
-    Convert system measurements dictionary to TelemetryPoint objects
+    Lazily convert system measurements dictionary to TelemetryPoint objects
 
     Args:
         system_measurements: Dictionary with structure {system: {hardware: {device: {field: value}}}}
 
-    Returns:
-        List of TelemetryPoint objects
+    Yields:
+        TelemetryPoint objects
     """
-    telemetry_points = []
+    num_types = _NUMERIC_TYPES
+    id_str = _id_str
+    empty = _EMPTY_SENTINELS
 
     for system, system_data in system_measurements.items():
         measurement_name = system.replace(' ', '_')
 
         for hardware_id, hardware_data in system_data.items():
             for device_id, device_data in hardware_data.items():
-                if device_data:  # Only process if there's actual data
-                    tags = {
-                        "hardware_id": str(hardware_id),
-                        "device_id": str(device_id)
-                    }
-
-                    # Filter out non-numeric fields or convert them appropriately
-                    fields = {}
-                    for key, value in device_data.items():
-                        if isinstance(value, (int, float, bool)):
-                            fields[key] = value
-                        elif isinstance(value, str):
-                            # Only include string fields if they're meaningful
-                            if value and value.lower() not in ['none', 'null', '']:
-                                fields[f"{key}_str"] = value
-
-                    if fields:  # Only create point if we have valid fields
-                        point = TelemetryPoint(
-                            measurement=measurement_name,
-                            tags=tags,
-                            fields=fields
-                        )
-                        telemetry_points.append(point)
-
-    return telemetry_points
+                if not device_data:  # Only process if there's actual data
+                    continue
+
+                # Keep numeric fields as-is; only include string fields if they're meaningful.
+                # One pass in device_data order, so field order (and which value wins when a
+                # "<key>_str" name collides) is the same as the device reported it
+                fields = {}
+                for k, v in device_data.items():
+                    if isinstance(v, num_types):
+                        fields[k] = v
+                    elif isinstance(v, str) and v and (len(v) > 4 or v.lower() not in empty):
+                        fields[f"{k}_str"] = v
+
+                if fields:  # Only create point if we have valid fields
+                    yield TelemetryPoint(
+                        measurement=measurement_name,
+                        tags={
+                            "hardware_id": id_str(hardware_id),
+                            "device_id": id_str(device_id)
+                        },
+                        fields=fields
+                    )
+
+
+def create_system_telemetry_points(system_measurements: Dict[str, Any]) -> List[TelemetryPoint]:
+    """
+    Convert system measurements dictionary to TelemetryPoint objects
+
+    Args:
+        system_measurements: Dictionary with structure {system: {hardware: {device: {field: value}}}}
+
+    Returns:
+        List of TelemetryPoint objects
+    """
+    return list(iter_system_telemetry_points(system_measurements))
 
 
 def create_actuator_telemetry_points(test_metrics_list: List[Dict[str, Any]],
@@ -230,8 +310,8 @@ def create_actuator_telemetry_points(test_metrics_list: List[Dict[str, Any]],
 
     for metrics in test_metrics_list:
         tags = {
-            "actuator_id": str(metrics.get("actuator_id", "unknown")),
-            "operation_type": str(metrics.get("operation_type", "unknown")),
+            "actuator_id": _id_str(metrics.get("actuator_id", "unknown")),
+            "operation_type": _id_str(metrics.get("operation_type", "unknown")),
             "cycle_number": str(metrics.get("cycle_number", 0))
         }
 
@@ -251,7 +331,7 @@ def create_actuator_telemetry_points(test_metrics_list: List[Dict[str, Any]],
             # Use the timestamp from metrics if available
             timestamp = metrics.get("timestamp")
             if timestamp:
-                timestamp = int(timestamp * 1000000000)  # Convert to nanoseconds
+                timestamp = int(timestamp * 1_000_000_000)  # Convert to nanoseconds
 
             point = TelemetryPoint(
                 measurement=measurement_name,
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 from raptor_common.utils.envvars import (EnvVars)
 
 FORMAT_FLAT = "flat-1"
@@ -17,9 +18,7 @@ class MQTTConfig:
     keepalive: int = 60
 
     def __post_init__(self):
-        if not isinstance(self.port, int):
-            raise ValueError("Port must be an integer")
-        if self.port < 1 or self.port > 65535:
+        if not (1 <= self.port <= 65535):
             raise ValueError("Port must be between 1 and 65535")
 
 
@@ -28,7 +27,7 @@ class MQTTConfig:
         """Create an MQTTConfig instance from a dictionary"""
         return cls(
             broker=data['broker'],
-            port=data['port'],
+            port=int(data['port']),
             username=data['username'],
             password=data['password'],
             client_id=data['client_id'],
@@ -36,12 +35,15 @@ class MQTTConfig:
         )
 
     @classmethod
-    def get_mqtt_config(cls) -> 'MQTTConfig':
+    def get_mqtt_config(cls, username: Optional[str] = None, passwd: Optional[str] = None,
+                        client_id: Optional[str] = None, form: str = FORMAT_FLAT) -> 'MQTTConfig':
+        """Build the config from the environment; the credentials and client id can be overridden"""
+        env = EnvVars()
         return cls(
-            broker=EnvVars().mqtt_broker,
-            port=EnvVars().mqtt_port,
-            username=EnvVars().mqtt_root,
-            password=EnvVars().mqtt_root_pass,
-            client_id=EnvVars().mqtt_client_id,
-            format=FORMAT_FLAT
+            broker=env.mqtt_broker,
+            port=env.mqtt_port,
+            username=username or env.mqtt_root,
+            password=passwd or env.mqtt_root_pass,
+            client_id=client_id or env.mqtt_client_id,
+            format=form
         )
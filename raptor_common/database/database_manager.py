@@ -1,13 +1,86 @@
 from typing import Optional, Union, Dict, Any, Iterable, List, Tuple
+from contextlib import contextmanager
 from pathlib import Path
 import sqlite3
 from sqlite3 import Connection
 from raptor_common.utils.singleton import Singleton
 import time
 import shutil
+import atexit
+import fcntl
+import logging
+import os
 
 from raptor_common.utils import LogManager
-import json
+import orjson
+
+
+# Applied to every connection.  foreign_keys is deliberately not enabled: the migrated network tables
+# declare foreign keys that existing writers have never had enforced.
+_CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA busy_timeout=30000',
+)
+# Hot telemetry statements, kept as constants so each maps to one prepared statement in the
+# connection's statement cache
+_SQL_INSERT_TELEMETRY = "INSERT INTO telemetry_data (data) VALUES (?)"
+_SQL_COUNT_TELEMETRY = "SELECT COUNT(*) FROM telemetry_data"
+# id is the rowid and increases with insert time, so ordering by it walks the table B-tree with no sort
+_SQL_SELECT_TELEMETRY = "SELECT id, data, timestamp FROM telemetry_data ORDER BY id DESC LIMIT ?"
+# Binding the ids as one JSON array keeps a single statement whatever the batch size.  json_each is
+# only guaranteed to be built in from SQLite 3.38; older libraries delete in fixed-size chunks, with
+# the last chunk padded with NULLs (which match nothing) so the statement text never changes.
+_HAS_JSON_EACH = sqlite3.sqlite_version_info >= (3, 38)
+_SQL_DELETE_TELEMETRY_IDS = "DELETE FROM telemetry_data WHERE id IN (SELECT value FROM json_each(?))"
+_DELETE_CHUNK = 500
+_SQL_DELETE_TELEMETRY_CHUNK = f"DELETE FROM telemetry_data WHERE id IN ({','.join('?' * _DELETE_CHUNK)})"
+_SQL_CLEAR_TELEMETRY = "DELETE FROM telemetry_data"
+
+_SQL_INSERT_HARDWARE = """
+    INSERT INTO hardware (hardware_type, driver_path, parameters, scan_groups, devices, external_ref)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+# Bulk form of the above binding a single JSON array of row arrays; the JSON columns are carried as
+# already-encoded strings so they are stored exactly as the row-by-row insert stores them
+_SQL_INSERT_HARDWARE_JSON = """
+    INSERT INTO hardware (hardware_type, driver_path, parameters, scan_groups, devices, external_ref)
+    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]'),
+           json_extract(value, '$[3]'), json_extract(value, '$[4]'), json_extract(value, '$[5]')
+    FROM json_each(?)
+"""
+
+# How often a long-lived connection refreshes the query planner statistics
+_OPTIMIZE_INTERVAL_S = 15 * 60
+
+
+def _apply_pragmas(connection: Connection):
+    for pragma in _CONNECTION_PRAGMAS:
+        connection.execute(pragma)
+
+
+_FICLONE = 0x40049409  # Linux ioctl: share src's extents with dst (reflink) on btrfs/xfs
+
+
+def _copy_file(src: Path, dst: Path):
+    """
+    Copy src to dst with metadata, like shutil.copy2, as cheaply as the filesystem allows: a reflink
+    clone where supported, otherwise an in-kernel copy_file_range loop, otherwise a userspace copy.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+            except (OSError, AttributeError):
+                # copy_file_range advances both file offsets, so this resumes where it stopped
+                shutil.copyfileobj(fsrc, fdst)
+    shutil.copystat(src, dst)
 
 
 class DatabaseManager(metaclass=Singleton):
@@ -19,29 +92,48 @@ class DatabaseManager(metaclass=Singleton):
         if schema_path:
             self.schema_path = Path(schema_path)
         self._connection: Optional[Connection] = None
-        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._transaction_depth = 0
+        self._last_optimize = time.monotonic()
+        # The connection is shared for the life of the process; close it cleanly on shutdown
+        atexit.register(self.close)
 
     @property
-    def connection(self, retries: int = 3):
+    def connection(self) -> Connection:
+        return self._get_connection()
+
+    def _get_connection(self, retries: int = 3) -> Connection:
         if self._connection is None:
             if retries <= 0:
                 raise sqlite3.OperationalError("Failed to connect after maximum retries")
 
             try:
                 self.logger.info(f"Connecting SQLite3 to :{self.db_path}")
-                self._connection = sqlite3.connect(self.db_path)
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._connection = sqlite3.connect(self.db_path, cached_statements=256)
                 self._connection.row_factory = sqlite3.Row
-                # Set pragmas
-                self._connection.execute('PRAGMA journal_mode=WAL')
-                self._connection.execute('PRAGMA synchronous=NORMAL')
+                _apply_pragmas(self._connection)
                 # Test connection is still good
                 self._connection.execute('SELECT 1')
-            except (sqlite3.Error, sqlite3.OperationalError) as e:
+            except sqlite3.OperationalError as e:
+                # Busy/locked database: drop the half-open connection and retry with backoff
                 self.logger.error(f"Try #{retries}.  Couldn't connect to SQLite3 database: {e}")
-                self._connection = None
-                return self.connection(retries - 1)
+                self._discard_connection()
+                time.sleep(0.05 * (4 - retries))
+                return self._get_connection(retries - 1)
+            except sqlite3.Error as e:
+                self.logger.error(f"Couldn't connect to SQLite3 database: {e}")
+                self._discard_connection()
+                raise
         return self._connection
 
+    def _discard_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except sqlite3.Error:
+                pass
+            self._connection = None
+
     def close(self):
         if self._connection:
             self._connection.close()
@@ -52,16 +144,57 @@ class DatabaseManager(metaclass=Singleton):
         return self.connection
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """Auto-close on context exit"""
-        self.close()
+        """Commit (or roll back on error) on context exit; the shared connection stays open"""
+        if exc_type is None:
+            self._commit()
+        elif self._connection is not None:
+            self._connection.rollback()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group several writes into a single transaction that commits (one fsync) on exit or rolls
+        back on error.  Nested use joins the outermost transaction.
+        """
+        connection = self.connection
+        self._transaction_depth += 1
+        try:
+            yield connection
+        except BaseException:
+            if self._transaction_depth == 1:
+                connection.rollback()
+            raise
+        else:
+            if self._transaction_depth == 1:
+                connection.commit()
+                self._maybe_optimize()
+        finally:
+            self._transaction_depth -= 1
+
+    def _commit(self):
+        """Commit now, unless inside transaction() which commits when the outermost block exits"""
+        if not self._transaction_depth:
+            self.connection.commit()
+            self._maybe_optimize()
+
+    def _maybe_optimize(self):
+        """Periodically let SQLite refresh statistics for the queries this connection has run"""
+        now = time.monotonic()
+        if now - self._last_optimize >= _OPTIMIZE_INTERVAL_S:
+            self._last_optimize = now
+            try:
+                self.connection.execute('PRAGMA optimize')
+            except sqlite3.Error as e:
+                self.logger.warning(f"PRAGMA optimize failed: {e}")
 
     def clear_existing_configuration(self):
         """ Clear the existing configuration data.  Keep the telemetry data in case of roll back? """
         try:
-            cursor = self.connection.cursor()
+            connection = self.connection
             # Delete all rows from telemetry table
-            cursor.execute("DELETE FROM telemetry_configuration")
-            cursor.execute("DELETE FROM hardware")
+            connection.execute("DELETE FROM telemetry_configuration")
+            connection.execute("DELETE FROM hardware")
+            self.set_configuration_hash(None)
             self.logger.info("TOD: Deleting rows from db")
 
         except sqlite3.Error as e:
@@ -70,10 +203,35 @@ class DatabaseManager(metaclass=Singleton):
             raise
 
 
+    def get_configuration_hash(self) -> Optional[str]:
+        """Hash of the configuration last stored from the cloud, None if unknown"""
+        try:
+            row = self.connection.execute("SELECT config_hash FROM configuration_state WHERE id = 1").fetchone()
+        except sqlite3.OperationalError as e:
+            # Database predates the configuration_state table: treat the stored configuration as unknown
+            self.logger.warning(f"Cannot read configuration hash: {e}")
+            return None
+        return row[0] if row else None
+
+
+    def set_configuration_hash(self, config_hash: Optional[str]):
+        """Record (or with None, forget) the hash of the stored configuration; committed by the caller"""
+        try:
+            if config_hash is None:
+                self.connection.execute("DELETE FROM configuration_state")
+            else:
+                self.connection.execute("""
+                    INSERT OR REPLACE INTO configuration_state (id, config_hash, updated_at)
+                    VALUES (1, ?, CURRENT_TIMESTAMP)
+                    """, (config_hash,))
+        except sqlite3.OperationalError as e:
+            # Only an optimisation: without the table every configuration is simply rewritten
+            self.logger.warning(f"Cannot record configuration hash: {e}")
+
+
     def update_telemetry(self, telemetry_config: str, mqtt_config: str):
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
+            self.connection.execute("""
                             INSERT INTO telemetry_configuration (mqtt_config, telemetry_config)
                             VALUES (?, ?)
                         """, (mqtt_config, telemetry_config))
@@ -85,8 +243,7 @@ class DatabaseManager(metaclass=Singleton):
 
     def add_raptor_id(self, raptor_config: Dict[str, str]):
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
+            self.connection.execute("""
                 INSERT OR REPLACE INTO raptor
                 (id, location, client)
                 VALUES (1, ?, ?)
@@ -105,30 +262,30 @@ class DatabaseManager(metaclass=Singleton):
     def add_hardware(self, hardware_configuration: Dict[str, Any]):
 
         try:
-            cursor = self.connection.cursor()
-            for hw_name, hw_config_list in hardware_configuration.items():
-                for the_hardware in hw_config_list:
-                    cursor.execute("""
-                            INSERT INTO hardware 
-                            (hardware_type, driver_path, parameters, scan_groups, devices, external_ref)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """, (
-                        hw_name,
-                        the_hardware['driver_path'],
-                        json.dumps(the_hardware["parameters"]),
-                        json.dumps(the_hardware.get("scan_groups", [])),
-                        json.dumps(the_hardware.get("devices")),
-                        the_hardware.get("crem3_id")
-                    ))
-                    self.logger.info(f":q"
-                                     f"Inserting: {hw_name}")
-            self.connection.commit()
-            self.logger.info("TOD:  Inserted into hardware table.")
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT COUNT(*) FROM hardware")
-            # Fetch the result (will be a tuple with one item)
-            count = cursor.fetchone()[0]
-            self.logger.info(f"Total row count: {count}")
+            rows = [
+                (
+                    hw_name,
+                    the_hardware['driver_path'],
+                    orjson.dumps(the_hardware["parameters"]).decode(),
+                    orjson.dumps(the_hardware.get("scan_groups", [])).decode(),
+                    orjson.dumps(the_hardware.get("devices")).decode(),
+                    the_hardware.get("crem3_id")
+                )
+                for hw_name, hw_config_list in hardware_configuration.items()
+                for the_hardware in hw_config_list
+            ]
+            if _HAS_JSON_EACH:
+                # One statement: SQLite unpacks the row array itself
+                self.connection.execute(_SQL_INSERT_HARDWARE_JSON, (orjson.dumps(rows).decode(),))
+            else:
+                self.connection.executemany(_SQL_INSERT_HARDWARE, rows)
+            self._commit()
+            # Skip the row count query when INFO is filtered
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("TOD:  Inserted into hardware table.")
+                # Fetch the result (will be a tuple with one item)
+                count = self.connection.execute("SELECT COUNT(*) FROM hardware").fetchone()[0]
+                self.logger.info("Total row count: %d", count)
             return True
 
         except sqlite3.Error as e:
@@ -144,9 +301,8 @@ class DatabaseManager(metaclass=Singleton):
 
     def clear_telemetry_data(self):
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("DELETE FROM telemetry_data")
-            self.connection.commit()
+            self.connection.execute(_SQL_CLEAR_TELEMETRY)
+            self._commit()
         except sqlite3.Error as e:
             self.connection.rollback()
             self.logger.error(f"Error clearing telemetry data: {e}")
@@ -156,17 +312,18 @@ class DatabaseManager(metaclass=Singleton):
 
     def remove_stored_telemetry_data(self, ids: List[int]):
         try:
-            cursor = self.connection.cursor()
             if not ids:
                 return
 
-            # Create placeholders for the IN clause
-            placeholders = ','.join('?' * len(ids))
-            cursor.execute(f"DELETE FROM telemetry_data WHERE id IN ({placeholders})", ids)
-            self.connection.commit()
+            if _HAS_JSON_EACH:
+                cursor = self.connection.execute(_SQL_DELETE_TELEMETRY_IDS, (orjson.dumps(ids).decode(),))
+            else:
+                chunks = (ids[i:i + _DELETE_CHUNK] for i in range(0, len(ids), _DELETE_CHUNK))
+                padded = (chunk + [None] * (_DELETE_CHUNK - len(chunk)) for chunk in chunks)
+                cursor = self.connection.executemany(_SQL_DELETE_TELEMETRY_CHUNK, padded)
+            self._commit()
 
-            deleted_count = cursor.rowcount
-            self.logger.info(f"Deleted {deleted_count} telemetry data rows.")
+            self.logger.info("Deleted %d telemetry data rows.", cursor.rowcount)
 
         except sqlite3.Error as e:
             self.logger.error(f"Database error removing telemetry data: {e}")
@@ -179,9 +336,7 @@ class DatabaseManager(metaclass=Singleton):
 
     def count_stored_telemetry_data(self) -> int:
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT COUNT(*) FROM telemetry_data")
-            count = cursor.fetchone()[0]
+            count = self.connection.execute(_SQL_COUNT_TELEMETRY).fetchone()[0]
             return count
 
         except sqlite3.Error as e:
@@ -195,25 +350,24 @@ class DatabaseManager(metaclass=Singleton):
 
     def get_stored_telemetry_data(self, back_log_limit: int = 200) -> Tuple[List[Dict[str, Any]], List[int]]:
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT id, data, timestamp FROM telemetry_data ORDER BY timestamp DESC LIMIT ?",
-                           (back_log_limit,))
-            rows = cursor.fetchall()
+            cursor = self.connection.execute(_SQL_SELECT_TELEMETRY, (back_log_limit,))
 
             result = []
             row_ids = []
+            result_append = result.append
+            row_ids_append = row_ids.append
 
-            for row in rows:
-                row_id, data_json, timestamp = row
-                telemetry_data = json.loads(data_json)
+            # Stream rows straight off the cursor rather than materialising them with fetchall()
+            for row_id, data_json, timestamp in cursor:
+                telemetry_data = orjson.loads(data_json)
                 # Add metadata from the database
                 telemetry_data['timestamp'] = timestamp
-                result.append(telemetry_data)
-                row_ids.append(row_id)
+                result_append(telemetry_data)
+                row_ids_append(row_id)
 
             lr = len(result)
-            if lr > 1:
-                self.logger.info(f"Collected backlog {lr} rows of telemetry data.")
+            if lr > 1 and self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("Collected backlog %d rows of telemetry data.", lr)
             return result, row_ids
 
         except sqlite3.Error as e:
@@ -226,14 +380,15 @@ class DatabaseManager(metaclass=Singleton):
 
 
     def store_telemetry_data(self, telemetry_data: Dict[str, Any]):
+        """
+        Write one telemetry row and commit it.  To store a burst of rows with a single commit,
+        call this inside transaction().
+        """
         try:
-            cursor = self.connection.cursor()
-            data_json = json.dumps(telemetry_data)
-            cursor.execute(
-                "INSERT INTO telemetry_data (data) VALUES (?)",
-                (data_json,)
-            )
-            self.connection.commit()
+            # Stored as TEXT; non-string keys are stringified as json.dumps did
+            data_json = orjson.dumps(telemetry_data, option=orjson.OPT_NON_STR_KEYS).decode()
+            self.connection.execute(_SQL_INSERT_TELEMETRY, (data_json,))
+            self._commit()
         except sqlite3.Error as e:
             self.connection.rollback()
             self.logger.error(f"Database error writing telemetry data: {e}")
@@ -248,36 +403,41 @@ class DatabaseManager(metaclass=Singleton):
     def get_hardware_systems(self, system: str) -> Iterable[dict]:
         """
         Iterate through each instance of hardware for the given system type "BMS", "Converters", etc.
+        The type must match hardware_type exactly (case-insensitively) so the lookup can use the index.
         Return a dictionary of data for each column.
         """
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
+            cursor = self.connection.execute("""
              SELECT id, hardware_type, driver_path, parameters, scan_groups, 
                        devices, enabled, external_ref 
                 FROM hardware 
-                WHERE hardware_type LIKE ?
-            """, (f'%{system}%',))
-
-            columns = [description[0] for description in cursor.description]
-            for row in cursor.fetchall():
-                config = dict(zip(columns, row))
-                config['parameters'] = json.loads(config['parameters'])
-                config['scan_groups'] = json.loads(config['scan_groups'])
-                config['devices'] = json.loads(config['devices'])
-                yield config
+                WHERE hardware_type = ? COLLATE NOCASE
+            """, (system,))
+
+            # fetchall() so the caller may use the connection while this generator is suspended
+            for (hardware_id, hardware_type, driver_path, parameters, scan_groups,
+                 devices, enabled, external_ref) in cursor.fetchall():
+                yield {
+                    'id': hardware_id,
+                    'hardware_type': hardware_type,
+                    'driver_path': driver_path,
+                    'parameters': orjson.loads(parameters),
+                    'scan_groups': orjson.loads(scan_groups),
+                    'devices': orjson.loads(devices),
+                    'enabled': enabled,
+                    'external_ref': external_ref
+                }
 
         except sqlite3.Error as e:
             self.logger.error(f"Database error retrieving {system} hardware: {e}")
             raise
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             self.logger.error(f"JSON parsing error: {e}")
             raise
 
     def get_current_firmware_version(self) -> Optional[Dict[str, str]]:
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
+            cursor = self.connection.execute("""
                 SELECT version_tag, timestamp FROM firmware_status ORDER BY timestamp DESC LIMIT 1
             """)
             result = cursor.fetchone()
@@ -288,13 +448,12 @@ class DatabaseManager(metaclass=Singleton):
 
     def add_firmware_version(self, version_tag: str):
         try:
-            cursor = self.connection.cursor()
             # Using CURRENT_TIMESTAMP for the timestamp value
-            cursor.execute("""
+            self.connection.execute("""
                    INSERT INTO firmware_status (version_tag, timestamp)
                    VALUES (?, CURRENT_TIMESTAMP)
                """, (version_tag,))
-            self.connection.commit()
+            self._commit()
         except Exception as e:
             self.connection.rollback()
             self.logger.error(f"Error inserting new version: {e}")
@@ -302,8 +461,7 @@ class DatabaseManager(metaclass=Singleton):
 
     def get_all_firmware_versions(self) -> List[Dict[str, str]]:
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
+            cursor = self.connection.execute("""
                 SELECT id, version_tag, timestamp
                 FROM firmware_status
                 ORDER BY timestamp DESC
@@ -320,6 +478,13 @@ class DatabaseManager(metaclass=Singleton):
         """
         self.logger.info("Starting database rebuild process")
 
+        # Fold the WAL into the main file so the backup is a single consistent file
+        if backup and self.db_path.exists():
+            try:
+                self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                self.logger.warning(f"WAL checkpoint before backup failed: {e}")
+
         # Close any existing connection
         self.close()
 
@@ -328,7 +493,7 @@ class DatabaseManager(metaclass=Singleton):
             if backup and self.db_path.exists():
                 backup_path = self.db_path.with_suffix(f'.bak.{int(time.time())}')
                 self.logger.info(f"Creating backup at {backup_path}")
-                shutil.copy2(self.db_path, backup_path)
+                _copy_file(self.db_path, backup_path)
 
             # Remove existing database file
             if self.db_path.exists():
@@ -344,8 +509,7 @@ class DatabaseManager(metaclass=Singleton):
                 temp_conn.row_factory = sqlite3.Row
 
                 # Set WAL mode and other pragmas
-                temp_conn.execute('PRAGMA journal_mode=WAL')
-                temp_conn.execute('PRAGMA synchronous=NORMAL')
+                _apply_pragmas(temp_conn)
 
                 # Read and execute schema
                 if not self.schema_path.exists():
@@ -379,7 +543,7 @@ class DatabaseManager(metaclass=Singleton):
                     self.logger.info("Attempting to restore from backup")
                     if self.db_path.exists():
                         self.db_path.unlink()
-                    shutil.copy2(backup_path, self.db_path)
+                    _copy_file(backup_path, self.db_path)
                     self.logger.info("Restored from backup successfully")
                 except Exception as restore_error:
                     self.logger.error(f"Failed to restore from backup: {restore_error}")
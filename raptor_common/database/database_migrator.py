@@ -14,10 +14,9 @@ class DatabaseMigrator:
 
 
 
-    def get_current_version(self) -> int:
+    def get_current_version(self, conn: sqlite3.Connection) -> int:
         """Get current database schema version"""
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
 
             # Check if schema_version table exists
@@ -47,15 +46,13 @@ class DatabaseMigrator:
         except Exception as e:
             self.logger.error(f"Error getting database version: {e}")
             return 0
-        finally:
-            conn.close()
 
 
 
-    def apply_migration(self, version: int, description: str, sql_statements: List[str]) -> bool:
-        """Apply a single migration"""
+    def apply_migration(self, conn: sqlite3.Connection, version: int, description: str,
+                        sql_statements: List[str]) -> bool:
+        """Apply a single migration in its own transaction, left open for the caller to commit"""
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
 
             # Check if this version is already applied
@@ -64,10 +61,11 @@ class DatabaseMigrator:
                 self.logger.info(f"Migration {version} already applied, skipping")
                 return True
 
-            # Apply migration statements
-            for sql in sql_statements:
-                if sql.strip():  # Skip empty statements
-                    cursor.execute(sql)
+            # Apply migration statements as one script, skipping empty statements.  executescript commits
+            # any open transaction first, so the script opens the migration's own transaction, which
+            # stays open for the version record below.
+            statements = [sql.strip() for sql in sql_statements if sql.strip()]
+            cursor.executescript("BEGIN;\n" + ";\n".join(statements) + ";")
 
             # Record migration
             cursor.execute("""
@@ -75,39 +73,41 @@ class DatabaseMigrator:
                 VALUES (?, ?)
             """, (version, description))
 
-            conn.commit()
             self.logger.info(f"Applied migration {version}: {description}")
             return True
 
         except Exception as e:
             self.logger.error(f"Error applying migration {version}: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
 
 
 
     def migrate_to_latest(self) -> bool:
-        """Apply all pending migrations"""
-        current_version = self.get_current_version()
-        self.logger.info(f"Current database version: {current_version}")
-
-        # Define all migrations
-        migrations = self.get_migrations()
-
-        success = True
-        for version, description, sql_statements in migrations:
-            if version > current_version:
-                if not self.apply_migration(version, description, sql_statements):
-                    success = False
-                    break
-
-        if success:
-            final_version = self.get_current_version()
-            self.logger.info(f"Database migrated to version {final_version}")
-
-        return success
+        """Apply all pending migrations over one connection, each in its own transaction"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            current_version = self.get_current_version(conn)
+            self.logger.info(f"Current database version: {current_version}")
+
+            # Define all migrations
+            migrations = self.get_migrations()
+
+            success = True
+            for version, description, sql_statements in migrations:
+                if version > current_version:
+                    if not self.apply_migration(conn, version, description, sql_statements):
+                        conn.rollback()
+                        success = False
+                        break
+                    conn.commit()
+
+            if success:
+                final_version = self.get_current_version(conn)
+                self.logger.info(f"Database migrated to version {final_version}")
+
+            return success
+        finally:
+            conn.close()
 
 
 
@@ -215,6 +215,18 @@ class DatabaseMigrator:
                     FOREIGN KEY (interface_name) REFERENCES network_interfaces(interface_name),
                     FOREIGN KEY (tunnel_name) REFERENCES ssh_tunnel_config(tunnel_name)
                 )"""
+            ]),
+
+            # Version 4 is retired: it indexed hardware(hardware_type), but the hardware table comes from
+            # schema.sql and may not exist when migrations run.  schema.sql creates idx_hardware_type.
+
+            # Migration 5: Track which configuration is stored
+            (5, "Add configuration_state table", [
+                """CREATE TABLE IF NOT EXISTS configuration_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    config_hash TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )"""
             ])
         ]
 
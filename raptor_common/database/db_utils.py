@@ -1,5 +1,5 @@
 from typing import Optional
-import json
+import orjson
 from logging import Logger
 import sqlite3
 
@@ -10,8 +10,18 @@ from config.telemetry_config import TelemetryConfig
 from config.raptor_config import RaptorConfig
 
 
+_DB: Optional[DatabaseManager] = None
+
+
+def _db() -> DatabaseManager:
+    global _DB
+    if _DB is None:
+        _DB = DatabaseManager(EnvVars().db_path)
+    return _DB
+
+
 def get_api_key(logger: Logger):
-    db = DatabaseManager(EnvVars().db_path)
+    db = _db()
     try:
         with db.connection as conn:
             cursor = conn.execute("SELECT * FROM commission LIMIT 1")
@@ -26,7 +36,7 @@ def get_api_key(logger: Logger):
 
 
 def get_telemetry_config(logger: Logger) -> Optional[TelemetryConfig]:
-    db = DatabaseManager(EnvVars().db_path)
+    db = _db()
     try:
         with db.connection as conn:
             cursor = conn.execute("SELECT telemetry_config FROM telemetry_configuration LIMIT 1")
@@ -34,7 +44,7 @@ def get_telemetry_config(logger: Logger) -> Optional[TelemetryConfig]:
             if not data:
                 logger.error("Unable to access Telemetry data from telemetry_configuration table database.")
                 raise ValueError("Unable to access Telemetry data from telemetry_configuration table database.")
-            config = json.loads(data['telemetry_config'])
+            config = orjson.loads(data['telemetry_config'])
             return TelemetryConfig.from_dict(config)
     except sqlite3.Error as e:
         logger.error(f"Failed to get telemetry config data: {e}")
@@ -42,7 +52,7 @@ def get_telemetry_config(logger: Logger) -> Optional[TelemetryConfig]:
 
 
 def get_mqtt_config(logger: Logger) -> Optional[MQTTConfig]:
-    db = DatabaseManager(EnvVars().db_path)
+    db = _db()
     try:
         with db.connection as conn:
             cursor = conn.execute("SELECT mqtt_config FROM telemetry_configuration LIMIT 1")
@@ -50,7 +60,7 @@ def get_mqtt_config(logger: Logger) -> Optional[MQTTConfig]:
             if not data:
                 logger.error("Unable to access MQTT data from telemetry_configuration table database.")
                 raise ValueError("Unable to access MQTT data from telemetry_configuration table database.")
-            config = json.loads(data['mqtt_config'])
+            config = orjson.loads(data['mqtt_config'])
             logger.info(f"Instantiate MQTT config: {config}")
             return MQTTConfig.from_dict(config)
     except sqlite3.Error as e:
@@ -59,7 +69,7 @@ def get_mqtt_config(logger: Logger) -> Optional[MQTTConfig]:
 
 
 def get_raptor_configuration(logger: Logger) -> Optional[RaptorConfig]:
-    db = DatabaseManager(EnvVars().db_path)
+    db = _db()
     try:
         with db.connection as conn:
             cursor = conn.execute("SELECT raptor_id, firmware_tag, api_key FROM commission LIMIT 1")
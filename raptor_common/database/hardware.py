@@ -1,8 +1,8 @@
-import importlib
-import inspect
-from typing import Union
+from typing import Dict, Type, Union
 from pathlib import Path
-import json
+import mmap
+
+import orjson
 
 from hardware.modbus.modbus_hardware import ModbusHardware
 from hardware.modbus import InviewGateway
@@ -12,6 +12,15 @@ from hardware.renogy_rover import RenogyRover
 
 # TODO:  Add the load/save of hardware to the SQLite local database.
 
+# Hardware classes that can be built from a configuration, keyed by class name
+FACTORIES: Dict[str, Type[ModbusHardware]] = {
+    "ModbusHardware": ModbusHardware,
+    "InviewGateway": InviewGateway,
+    "EveBattery": EveBattery,
+    "RenogyRover": RenogyRover,
+}
+
+
 def load_hardware_from_dict(hardware_config: dict) -> ModbusHardware:
     hardware = hardware_config.get('hardware')
     class_path = hardware.get("type")
@@ -25,21 +34,12 @@ def load_hardware_from_dict(hardware_config: dict) -> ModbusHardware:
     except ValueError:
         raise ValueError(f"Invalid class path format: {class_path}. Expected format: 'module.path.ClassName'")
 
-    try:
-        # Import the module and get the class
-        cls = globals()[class_name]
+    cls = FACTORIES.get(class_name)
+    if cls is None:
+        raise ImportError(f"Unknown hardware class: {class_name}")
 
-        # Verify it's a subclass of ModbusHardware
-        if not inspect.isclass(cls) or not issubclass(cls, ModbusHardware):
-            raise ValueError(f"Class {class_name} is not a subclass of ModbusHardware")
-
-        constructor_config = hardware.get("parameters", {})
-        return cls(**constructor_config)
-
-    except ImportError:
-        raise ImportError(f"Could not import module: {module_path}")
-    except AttributeError:
-        raise ImportError(f"Could not find class {class_name} in module {module_path}")
+    constructor_config = hardware.get("parameters", {})
+    return cls(**constructor_config)
 
 
 def load_hardware_from_json_file(json_file: Union[Path, str]) -> ModbusHardware:
@@ -47,9 +47,11 @@ def load_hardware_from_json_file(json_file: Union[Path, str]) -> ModbusHardware:
     if not json_path.exists():
         raise FileNotFoundError(f"Configuration file not found: {json_file}")
 
-    with json_path.open('r') as f:
-        try:
-            data = json.load(f)
-            return load_hardware_from_dict(data)
-        except json.JSONDecodeError:
-            raise ValueError(f"Invalid JSON in configuration file: {json_file}")
+    # Parse straight from the page-cache mapping instead of copying the file into a str first
+    try:
+        with json_path.open('rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                memoryview(mm) as view:
+            data = orjson.loads(view)
+    except ValueError:  # orjson.JSONDecodeError, or mmap of an empty file
+        raise ValueError(f"Invalid JSON in configuration file: {json_file}")
+    return load_hardware_from_dict(data)
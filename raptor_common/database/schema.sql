@@ -14,6 +14,13 @@ CREATE TABLE IF NOT EXISTS telemetry_configuration (
     telemetry_config TEXT
 );
 
+-- Hash of the configuration last stored from the cloud, written in the same transaction as it
+CREATE TABLE IF NOT EXISTS configuration_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    config_hash TEXT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE IF NOT EXISTS hardware (
     id INTEGER PRIMARY KEY,
     hardware_type TEXT NOT NULL,
@@ -25,6 +32,8 @@ CREATE TABLE IF NOT EXISTS hardware (
     external_ref TEXT NOT NULL
 );
 
+CREATE INDEX IF NOT EXISTS idx_hardware_type ON hardware(hardware_type COLLATE NOCASE);
+
 CREATE TABLE IF NOT EXISTS telemetry_data (
     id  INTEGER PRIMARY KEY,
     data TEXT,
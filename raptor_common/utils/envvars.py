@@ -7,6 +7,9 @@ import sys
 from .singleton import Singleton
 
 
+_MISSING = object()
+
+
 class EnvVars(metaclass=Singleton):
 
     def __init__(self):
@@ -46,10 +49,11 @@ class EnvVars(metaclass=Singleton):
 
 
     def get_env(self, variable: str, default: Optional[str] = None) -> Optional[str]:
-        return self.env_variables.get(variable) or self.env_variables.setdefault(
-            variable,
-            os.getenv(variable, default)
-        )
+        # Cache the raw environment value (None when unset) so each call's default still applies
+        value = self.env_variables.get(variable, _MISSING)
+        if value is _MISSING:
+            value = self.env_variables[variable] = os.getenv(variable)
+        return default if value is None else value
 
 
     def _get_required(self, key: str) -> str:
@@ -1,9 +1,52 @@
 from logging import Logger
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Union
 import subprocess
 from subprocess import CompletedProcess
 import time
-import re
+import functools
+import getpass
+import ipaddress
+import json
+import os
+import shlex
+import shutil
+
+
+# ifconfig fallback parsing: keywords whose following token is the value, mapped to check_interface info keys
+_IFCONFIG_FIELDS = {
+    'inet': 'ip_address',
+    'netmask': 'netmask',
+    'broadcast': 'broadcast',
+    'ether': 'mac_address',
+    'HWaddr': 'mac_address',
+    'mtu': 'mtu',
+}
+# BusyBox / old net-tools glue the value to its label instead ('inet addr:10.0.0.2  Bcast:...  Mask:...')
+_IFCONFIG_LABELS = {
+    'Bcast': 'broadcast',
+    'Mask': 'netmask',
+    'MTU': 'mtu',
+}
+
+# Where screen keeps its per-user socket directories (S-<user>), unless SCREENDIR overrides it
+_SCREEN_BASE_DIRS = ('/run/screen', '/var/run/screen')
+
+_SCREEN_QUIT_TIMEOUT_S = 1.0
+_SCREEN_QUIT_POLL_S = 0.02
+# Poll interval when each check has to fork 'screen -ls'
+_SCREEN_LS_POLL_S = 0.25
+
+# Anything that needs a shell to interpret it (expansion, redirection, chaining, env assignment, comments)
+_SHELL_CHARS = frozenset(';|&$`*?<>()~{}=#\n')
+# Shell keywords and builtins that some systems also ship as (different) executables, e.g. /usr/bin/time
+# or /usr/bin/cd; anything else runs directly only if it resolves to an executable
+_SHELL_BUILTINS = frozenset({
+    '.', ':', 'alias', 'bg', 'break', 'builtin', 'case', 'cd', 'command', 'continue', 'declare', 'dirs',
+    'disown', 'eval', 'exec', 'exit', 'export', 'fc', 'fg', 'for', 'function', 'getopts', 'hash', 'if',
+    'jobs', 'let', 'local', 'popd', 'pushd', 'read', 'readonly', 'return', 'select', 'set', 'shift',
+    'shopt', 'source', 'time', 'trap', 'type', 'typeset', 'ulimit', 'umask', 'unalias', 'unset', 'until',
+    'wait', 'while', '[[', '!', '{',
+})
 
 
 def local_logger(logger: Optional[Logger] = None):
@@ -13,69 +56,108 @@ def local_logger(logger: Optional[Logger] = None):
     return logger
 
 
-def run_command_direct(command: List[str], logger: Optional[Logger] = None) -> Optional[CompletedProcess]:
-    """Run a shell command and return output and status."""
-    logger = local_logger(logger)
+def _run(command: List[str], logger: Logger, text: bool = True) -> Optional[CompletedProcess]:
+    """ Shared subprocess call for the run_command helpers; None when the command fails """
     logger.info(f"Running process: {command}")
     try:
-        result = subprocess.run(
+        return subprocess.run(
             command,
             capture_output=True,
-            text=True,
+            text=text,
             check=True
         )
-        return result
     except subprocess.CalledProcessError as e:
         logger.error(f"Command failed: {' '.join(command)}")
         logger.error(f"Error output: {e.stderr}")
         return None
 
 
+def run_command_direct(command: List[str], logger: Optional[Logger] = None) -> Optional[CompletedProcess]:
+    """Run a shell command and return output and status."""
+    return _run(command, local_logger(logger))
+
+
 # Dumb implementation here:
 def run_command(command: List[str], logger: Optional[Logger] = None) -> tuple:
     """Run a shell command and return output and status."""
+    result = _run(command, local_logger(logger))
+    if result is None:
+        return "Error running command", False
+    return result.stdout.strip(), True
+
+
+def set_tcp_interface(interface_name: str, expected_ip: str, logger: Optional[Logger]) -> Tuple[bool, dict]:
     logger = local_logger(logger)
-    logger.info(f"Running process: {command}")
+    # Both values are spliced into an ip -batch script, where whitespace would start new arguments or commands
     try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip(), True
+        ipaddress.ip_interface(expected_ip)
+    except ValueError:
+        logger.error(f"Cannot reconfigure {interface_name}: invalid address {expected_ip!r}")
+        return check_interface(interface_name, logger)
+    if not interface_name or any(c.isspace() for c in interface_name):
+        logger.error(f"Cannot reconfigure invalid interface name {interface_name!r}")
+        return check_interface(interface_name, logger)
+
+    # One ip process runs the whole sequence; -batch stops at the first failing line
+    script = (f"link set {interface_name} down\n"
+              f"addr flush dev {interface_name}\n"
+              f"addr add {expected_ip} dev {interface_name}\n"
+              f"link set {interface_name} up\n")
+    logger.info(f"Running process: ip -batch - ({interface_name} -> {expected_ip})")
+    try:
+        subprocess.run(['ip', '-batch', '-'], input=script, capture_output=True, text=True, check=True)
     except subprocess.CalledProcessError as e:
-        logger.error(f"Command failed: {' '.join(command)}")
+        logger.error(f"Cannot reconfigure {interface_name} to {expected_ip}")
         logger.error(f"Error output: {e.stderr}")
-        return "Error running command", False
 
+    return check_interface(interface_name, logger)
 
-def set_tcp_interface(interface_name: str, expected_ip: str, logger: Optional[Logger]) -> Tuple[bool, dict]:
-    cmd = ['ip', 'link', 'set', interface_name, 'down']
-    output, status = run_command(cmd, logger)
-    if not status:
-        logger.error(f"Cannot run ip link set {interface_name} down")
-        return check_interface(interface_name, logger)
 
-    cmd = ['ip', 'addr', 'flush', 'dev', interface_name]
-    output, status = run_command(cmd, logger)
-    if not status:
-        logger.error(f"Cannot flush addr on {interface_name}")
-        return check_interface(interface_name, logger)
+def _parse_ip_link(link: dict, info: dict):
+    """ Fill the check_interface info from one entry of `ip -j addr show` """
+    flags = link.get('flags', [])
+    info['is_up'] = 'UP' in flags
+    info['is_running'] = 'LOWER_UP' in flags
+    info['mtu'] = link.get('mtu')
+    if link.get('link_type') == 'ether':
+        info['mac_address'] = link.get('address')
 
-    cmd = ['ip', 'addr', 'add',  f"{expected_ip}", "dev", interface_name]
-    output, status = run_command(cmd, logger)
-    if not status:
-        logger.error(f"Cannot run ip link set {interface_name} down")
-        return check_interface(interface_name, logger)
+    for addr in link.get('addr_info', []):
+        if addr.get('family') == 'inet':
+            info['ip_address'] = addr.get('local')
+            if 'prefixlen' in addr:
+                info['netmask'] = str(ipaddress.IPv4Network((0, addr['prefixlen'])).netmask)
+            info['broadcast'] = addr.get('broadcast')
+            break
 
-    cmd = ['ip', 'link', 'set', interface_name, 'up']
-    output, status = run_command(cmd, logger)
-    if not status:
-        logger.error(f"Cannot run ip link set {interface_name} up")
-        return check_interface(interface_name, logger)
 
-    return check_interface(interface_name, logger)
+def _parse_ifconfig(output: str, info: dict):
+    """ Fill the check_interface info from ifconfig text output """
+    # Check interface status flags
+    if 'UP' in output:
+        info['is_up'] = True
+    if 'RUNNING' in output:
+        info['is_running'] = True
+
+    # Extract IP, MAC and MTU from the token following each keyword, or after a 'Label:' prefix;
+    # the first occurrence of each wins
+    tokens = iter(output.split())
+    for token in tokens:
+        key = _IFCONFIG_FIELDS.get(token)
+        if key is not None:
+            value = next(tokens, None)
+            if value is not None and value.startswith('addr:'):
+                value = value[len('addr:'):]
+        else:
+            label, sep, value = token.partition(':')
+            key = _IFCONFIG_LABELS.get(label) if sep else None
+            if key is None:
+                continue
+        if info.get(key) is None:
+            if key == 'mtu':
+                info['mtu'] = int(value) if value and value.isdigit() else None
+            else:
+                info[key] = value
 
 
 def check_interface(interface_name: str, logger: Optional[Logger]) -> Tuple[bool, dict]:
@@ -90,39 +172,26 @@ def check_interface(interface_name: str, logger: Optional[Logger]) -> Tuple[bool
         'mac_address': None,
         'mtu': None
     }
-    cmd = ['ifconfig', interface_name]
-    output, success = run_command(cmd, logger)
-    info['cmd_success'] = success
-    if not success:
-        return False, info
-
-    # Check interface status flags
-    if 'UP' in output:
-        info['is_up'] = True
-    if 'RUNNING' in output:
-        info['is_running'] = True
-
-    # Extract IP information
-    inet_pattern = r'inet\s+(\d+\.\d+\.\d+\.\d+)(?:\s+netmask\s+(\d+\.\d+\.\d+\.\d+))?(?:\s+broadcast\s+(\d+\.\d+\.\d+\.\d+))?'
-    inet_match = re.search(inet_pattern, output)
-    if inet_match:
-        info['ip_address'] = inet_match.group(1)
-        if inet_match.group(2):
-            info['netmask'] = inet_match.group(2)
-        if inet_match.group(3):
-            info['broadcast'] = inet_match.group(3)
-
-    # Extract MAC address
-    mac_pattern = r'ether\s+([0-9a-fA-F:]{17})'
-    mac_match = re.search(mac_pattern, output)
-    if mac_match:
-        info['mac_address'] = mac_match.group(1)
-
-    # Extract MTU
-    mtu_pattern = r'mtu\s+(\d+)'
-    mtu_match = re.search(mtu_pattern, output)
-    if mtu_match:
-        info['mtu'] = int(mtu_match.group(1))
+    link = None
+    try:
+        # json.loads takes the raw bytes, so skip decoding stdout
+        result = _run(['ip', '-j', 'addr', 'show', 'dev', interface_name], logger, text=False)
+        if result is not None:
+            link = json.loads(result.stdout)[0]
+    except (FileNotFoundError, ValueError, IndexError):
+        link = None
+
+    if link is not None:
+        info['cmd_success'] = True
+        _parse_ip_link(link, info)
+    else:
+        # No usable iproute2 JSON output (or the interface is missing): fall back to ifconfig
+        cmd = ['ifconfig', interface_name]
+        output, success = run_command(cmd, logger)
+        info['cmd_success'] = success
+        if not success:
+            return False, info
+        _parse_ifconfig(output, info)
 
     # Add convenience checks
     info['interface_good'] = (
@@ -134,17 +203,56 @@ def check_interface(interface_name: str, logger: Optional[Logger]) -> Tuple[bool
     return True, info
 
 
+def _screen_socket_dir() -> Optional[str]:
+    screen_dir = os.environ.get('SCREENDIR')
+    if screen_dir:
+        return screen_dir
+    for base in _SCREEN_BASE_DIRS:
+        if os.path.isdir(base):
+            return f"{base}/S-{getpass.getuser()}"
+    return _screen_ls_socket_dir()
+
+
+@functools.cache
+def _screen_ls_socket_dir() -> Optional[str]:
+    """ Ask screen once where its sockets live: the last line of 'screen -ls' ends '... in <dir>.' """
+    try:
+        result = subprocess.run(['screen', '-ls'], capture_output=True, text=True)
+    except OSError:
+        return None
+    lines = result.stdout.strip().splitlines()
+    socket_dir = lines[-1].partition(' in ')[2].strip().rstrip('.') if lines else ''
+    return socket_dir if socket_dir.startswith('/') else None
+
+
+def _session_exists(session_name: str) -> bool:
+    """ True if a screen session with this name is running; sockets are named <pid>.<session_name> """
+    socket_dir = _screen_socket_dir()
+    if socket_dir is None:
+        # Unknown socket location: let screen itself answer
+        result = subprocess.run(['screen', '-ls'], capture_output=True)
+        return session_name.encode() in result.stdout
+    try:
+        with os.scandir(socket_dir) as entries:
+            return any(entry.name.partition('.')[2] == session_name for entry in entries)
+    except FileNotFoundError:
+        return False
+
+
 def kill_screen_session(session_name: str, logger: Optional[Logger] = None) -> bool:
     """Kill an existing screen session."""
     logger = local_logger(logger)
     try:
         # Check if session exists
-        result = subprocess.run(['screen', '-ls'], capture_output=True, text=True)
-        if session_name in result.stdout:
+        if _session_exists(session_name):
             # Kill the session
             subprocess.run(['screen', '-X', '-S', session_name, 'quit'])
             logger.info(f"Killed screen: {session_name}")
-            time.sleep(1)  # Give it time to clean up
+            # Give it time to clean up: wait for its socket to go away, up to the old 1s pause
+            poll_s = _SCREEN_QUIT_POLL_S if _screen_socket_dir() else _SCREEN_LS_POLL_S
+            deadline = time.monotonic() + _SCREEN_QUIT_TIMEOUT_S
+            while _session_exists(session_name) and time.monotonic() < deadline:
+                time.sleep(poll_s)
         else:
             logger.info(f"No screen session {session_name} to kill")
         return True
@@ -153,7 +261,26 @@ def kill_screen_session(session_name: str, logger: Optional[Logger] = None) -> b
         return False
 
 
-def start_screen_session(session_name: str, command: str, cwd: Optional[str] = None,
+def _screen_argv(command: Union[str, List[str]], cwd: Optional[str] = None) -> List[str]:
+    """ screen execs a plain argv itself; only go through bash when the command needs a shell """
+    if not isinstance(command, str):
+        return list(command)
+    argv = None
+    if _SHELL_CHARS.isdisjoint(command):
+        try:
+            argv = shlex.split(command)
+        except ValueError:  # Unbalanced quotes: leave it to bash, as before
+            argv = None
+    if not argv or argv[0] in _SHELL_BUILTINS:
+        return ['bash', '-c', command]
+    # Functions, aliases and anything not on PATH are left to bash; relative paths resolve against cwd
+    program = os.path.join(cwd, argv[0]) if cwd and os.sep in argv[0] else argv[0]
+    if shutil.which(program) is None:
+        return ['bash', '-c', command]
+    return argv
+
+
+def start_screen_session(session_name: str, command: Union[str, List[str]], cwd: Optional[str] = None,
                          logger: Optional[Logger] = None) -> bool:
     """Start a new screen session."""
     logger = local_logger(logger)
@@ -163,7 +290,7 @@ def start_screen_session(session_name: str, command: str, cwd: Optional[str] = N
             'screen',
             '-dmS',  # Create and detach
             session_name,
-            'bash', '-c', command
+            *_screen_argv(command, cwd)
         ], cwd=cwd, check=True)
         logger.info(f"Started screen session: {session_name}")
         return True
@@ -1,8 +1,10 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from .singleton import Singleton
-from typing import Dict
+from typing import Dict, Set
 from .envvars import EnvVars
 
 
@@ -10,7 +12,10 @@ class LogManager(metaclass=Singleton):
 
     def __init__(self, log_filename: str = "raptor.log"):
         self._loggers: Dict[str, logging.Logger] = {}
+        self._configured: Set[int] = set()  # id() of library loggers already pointed at our handler
         self._file_handler = None
+        self._queue_handler = None
+        self._listener = None
         self._log_dir = Path(EnvVars().log_path)
         self._setup_base_config(log_filename)
 
@@ -36,6 +41,14 @@ class LogManager(metaclass=Singleton):
                 '%(asctime)s - %(name)s - %(levelname)s - %(message)s - [%(filename)s:%(lineno)d]'
             )
             self._file_handler.setFormatter(formatter)
+
+        if self._listener is None:
+            # Loggers only enqueue records; one background thread does the file writes and rollovers
+            log_queue = queue.Queue(-1)
+            self._queue_handler = QueueHandler(log_queue)
+            self._listener = QueueListener(log_queue, self._file_handler, respect_handler_level=True)
+            self._listener.start()
+            atexit.register(self.cleanup)
         # # Create formatters
         # self.detailed_formatter = logging.Formatter(
         #     '%(asctime)s - %(name)s - %(levelname)s - %(message)s - [%(filename)s:%(lineno)d]'
@@ -47,24 +60,45 @@ class LogManager(metaclass=Singleton):
 
 
     def get_logger(self, name: str) -> logging.Logger:
-        if name not in self._loggers:
+        logger = self._loggers.get(name)
+        if logger is None:
+            level = EnvVars().log_level
             logger = logging.getLogger(name)
-            logger.setLevel(EnvVars().log_level)
+            logger.setLevel(level)
 
             # Remove any existing handlers
-            for handler in logger.handlers[:]:
-                logger.removeHandler(handler)
+            logger.handlers.clear()
 
-            # Add our single file handler
-            logger.addHandler(self._file_handler)
+            # Add our single (queued) file handler
+            logger.addHandler(self._active_handler())
 
             # Prevent propagation to root logger
             logger.propagate = False
 
             self._loggers[name] = logger
 
-        return self._loggers[name]
+        return logger
+
+
+    def _active_handler(self) -> logging.Handler:
+        """The queue while its listener runs; the file handler directly once it has been stopped"""
+        return self._queue_handler if self._listener is not None else self._file_handler
+
 
+    def cleanup(self):
+        """Point loggers back at the file handler, then drain queued records and stop the writer thread."""
+        if self._listener is None:
+            return
+        qh, fh = self._queue_handler, self._file_handler
+        # Swap first so records logged from now on bypass the queue; the listener drains what is left
+        loggers = [logging.getLogger()] + list(logging.Logger.manager.loggerDict.values())
+        for logger in loggers:
+            handlers = getattr(logger, 'handlers', None)  # PlaceHolder entries have no handlers
+            if handlers and qh in handlers:
+                logger.addHandler(fh)
+                logger.removeHandler(qh)
+        listener, self._listener = self._listener, None
+        listener.stop()
 
     def update_all_log_levels(self, level: int):
         """Update log level for all managed loggers."""
@@ -80,6 +114,7 @@ class LogManager(metaclass=Singleton):
         """Configure third-party libraries to use the same file handler"""
         if level is None:
             level = EnvVars().log_level
+        handler = self._active_handler()
 
         # Configure FastAPI and related libraries
         for logger_name in [
@@ -93,9 +128,11 @@ class LogManager(metaclass=Singleton):
             lib_logger = logging.getLogger(logger_name)
             lib_logger.setLevel(level)
 
-            # Add our file handler if not already there
-            if not any(isinstance(h, RotatingFileHandler) for h in lib_logger.handlers):
-                lib_logger.addHandler(self._file_handler)
+            # Add our file handler on the first configure only
+            if id(lib_logger) not in self._configured:
+                if handler not in lib_logger.handlers:
+                    lib_logger.addHandler(handler)
+                self._configured.add(id(lib_logger))
 
             # Prevent propagation to root logger to avoid duplicate logs
             lib_logger.propagate = False
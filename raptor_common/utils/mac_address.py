@@ -1,46 +1,59 @@
+import os
 import uuid
+from functools import lru_cache
 from typing import Optional
-import psutil
 
 
+# Neither value changes while the device is up, so read each once per process
+@lru_cache(maxsize=1)
 def get_mac_address_uuid():
     return ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff)
                      for elements in range(0, 2 * 6, 2)][::-1])
 
 
+@lru_cache(maxsize=1)
 def get_mac_address():
     try:
         with open('/etc/machine-id', 'r') as f:
             return f.read().strip()
-    except:
+    except OSError:
         return None
 
 
+_SYS_NET = '/sys/class/net'
+
+
+def _read_iface_mac(interface_name: str) -> Optional[str]:
+    try:
+        with open(f'{_SYS_NET}/{interface_name}/address', 'r') as f:
+            mac = f.read().strip()
+    except OSError:
+        return None
+    return mac if mac and mac != '00:00:00:00:00:00' else None
+
+
 # Possibly not ever used
 def get_system_mac_psutil(logger) -> Optional[str]:
     """
     Get the MAC address of the first non-loopback network interface.
+    Reads /sys/class/net directly rather than enumerating every address through psutil.
     Returns:
         str: MAC address if found, None otherwise
     """
-    try:
-        interfaces = psutil.net_if_addrs()
-
-        # Try ethernet interfaces first
-        for interface_name in ['end0', 'eth0', 'en0', 'ens33']:
-            if interface_name in interfaces:
-                for addr in interfaces[interface_name]:
-                    if addr.family == psutil.AF_LINK:
-                        return addr.address
+    # Try ethernet interfaces first
+    for interface_name in ['end0', 'eth0', 'en0', 'ens33']:
+        mac = _read_iface_mac(interface_name)
+        if mac:
+            return mac
 
-        # If no standard ethernet interface found, try any non-loopback interface
-        for interface_name, interface_addresses in interfaces.items():
+    # If no standard ethernet interface found, try any non-loopback interface
+    try:
+        for interface_name in os.listdir(_SYS_NET):
             if interface_name != 'lo':
-                for addr in interface_addresses:
-                    if addr.family == psutil.AF_LINK:
-                        return addr.address
-
-    except Exception as e:
+                mac = _read_iface_mac(interface_name)
+                if mac:
+                    return mac
+    except OSError as e:
         logger.error(f"Error getting MAC address: {str(e)}")
         return None
 
@@ -3,9 +3,12 @@ class Singleton(type):
     _instances = {}
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+        instances = cls._instances
+        instance = instances.get(cls)
+        if instance is None:
+            # Built outside any except block so errors from __init__ aren't chained to a KeyError
+            instance = instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+        return instance
 
     def has_instance(cls) -> bool:
         return cls in cls._instances
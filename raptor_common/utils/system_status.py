@@ -1,13 +1,51 @@
-from typing import Optional
-import psutil
+from typing import Dict, List, Optional, Tuple
 import subprocess
+import time
 
 COMMON_PATH = "/root/raptor-common"
+_THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+# psutil is imported on first use so importing utils doesn't pay for it
+_psutil = None
+# The first CPU reading has no previous call to measure from, so it samples this window instead
+_FIRST_CPU_SAMPLE_S = 0.1
+_cpu_sampled = False
+
+
+def _ps():
+    global _psutil
+    if _psutil is None:
+        import psutil
+        _psutil = psutil
+    return _psutil
+
+
+def _cpu_percent(psutil) -> float:
+    """ CPU usage since the previous call; the first call in the process blocks for a short sample """
+    global _cpu_sampled
+    if not _cpu_sampled:
+        _cpu_sampled = True
+        return psutil.cpu_percent(interval=_FIRST_CPU_SAMPLE_S)
+    return psutil.cpu_percent(interval=None)
+
+
+def _read_temperature() -> float:
+    """ CPU temperature in C from sysfs, falling back to psutil; 0 when neither is available """
+    try:
+        with open(_THERMAL_ZONE, 'rb') as f:
+            return int(f.read()) / 1000.0
+    except (OSError, ValueError):
+        pass
+    try:
+        return _ps().sensors_temperatures()['cpu_thermal'][0].current
+    except Exception:
+        return 0
 
 
 def collect_system_stats():
-    # Get CPU usage as a percentage
-    cpu_percent = psutil.cpu_percent(interval=1)
+    psutil = _ps()
+    # Get CPU usage as a percentage, averaged since the previous call
+    cpu_percent = _cpu_percent(psutil)
 
     # Get memory usage
     memory = psutil.virtual_memory()
@@ -22,11 +60,8 @@ def collect_system_stats():
     bytes_sent = network.bytes_sent
     bytes_recv = network.bytes_recv
 
-    # Temperature (if available)
-    try:
-        temperature = psutil.sensors_temperatures()['cpu_thermal'][0].current
-    except:
-        temperature = 0  # Set to 0 if not available
+    # Temperature (0 if not available)
+    temperature = _read_temperature()
 
     return {
         'cpu_percent': cpu_percent,
@@ -38,8 +73,18 @@ def collect_system_stats():
     }
 
 
-def get_git_branches(repo_path: Optional[str] = None, logger = None):
+# ls-remote results per repo path: (time.monotonic() of the fetch, branches)
+_branches_cache: Dict[str, Tuple[float, List[str]]] = {}
+
+
+def get_git_branches(repo_path: Optional[str] = None, logger = None, ttl: float = 60.0):
     """Get list of available git branches without fetching content"""
+    key = repo_path or ""
+    now = time.monotonic()
+    hit = _branches_cache.get(key)
+    if hit is not None and now - hit[0] < ttl:
+        return list(hit[1])
+
     cmd = ["git", "ls-remote", "--heads", "origin"]
     if repo_path:
         cmd = ["git", "-C", repo_path] + cmd[1:]
@@ -53,20 +98,16 @@ def get_git_branches(repo_path: Optional[str] = None, logger = None):
     if logger:
         logger.info(f"git ls-remote --heads origin returns: {result}")
 
-    branches = []
+    branches = {}
     for line in result.stdout.splitlines():
-        # Each line has format: "commit_hash refs/heads/branch_name"
-        if not line.strip():
-            continue
-
-        parts = line.split()
-        if len(parts) >= 2:
-            # Extract branch name from refs/heads/branch_name
-            branch = parts[1].replace("refs/heads/", "")
-            if branch and branch not in branches and not branch == "HEAD":
-                branches.append(branch)
-
-    return branches
+        # Each line has format: "commit_hash\trefs/heads/branch_name"
+        branch = line.partition('\t')[2].strip().removeprefix("refs/heads/")
+        if branch and branch != "HEAD":
+            branches[branch] = None
+
+    branches = list(branches)
+    _branches_cache[key] = (now, branches)
+    return list(branches)
 
 
 def get_current_branch(repo_path: Optional[str] = None) -> str: